@@ -1,7 +1,8 @@
 """ useful functions for adc measurements """
 from __future__ import print_function
-from time import localtime
+from time import localtime, time
 from collections import namedtuple
+import threading
 import warnings
 
 Channel = namedtuple('Channel', ['name', 'adc', 'nominal', 'gain_file'])
@@ -12,21 +13,122 @@ CHANNELS = [Channel(name='Cavity Cell Voltage', adc='adc4', nominal=26, gain_fil
             Channel(name='Laser after amp', adc='adc1', nominal=10, gain_file='BNC_AMP30_ATN-20')]
 
 try:
-    from epics import caget
+    import epics
     from epics.ca import ChannelAccessException
     try:
-        for channel in CHANNELS:
-            adc_vals(channel.adc)
+        epics.ca.initialize_libca()
     except ChannelAccessException:
         warnings.warn("Cannot find EPICS CA DLL, make sure to set PATH")
 except ImportError:
+    epics = None
     warnings.warn("Could not import pyepics")
 
-def adc_vals(channel):
+def adc_pvs(adc):
+    """ returns the (min, max) PV names of an adc """
+    return 'llrf1:' + adc + '_min', 'llrf1:' + adc + '_max'
+
+def adc_vals(channel, ca=None):
     """ returns tuple containing adc_min and adc_max for given channel """
-    adc_min = float(caget('llrf1:' + channel + '_min'))
-    adc_max = float(caget('llrf1:' + channel + '_max'))
-    return adc_min, adc_max
+    ca = epics if ca is None else ca
+    # caget_many connects and reads both PVs in parallel
+    adc_min, adc_max = ca.caget_many(adc_pvs(channel))
+    return float(adc_min), float(adc_max)
+
+def adc_vals_many(adcs, ca=None):
+    """
+    returns {adc: (adc_min, adc_max)} for adcs, reading the PVs of every adc
+    in a single caget_many so they are sampled together
+    """
+    ca = epics if ca is None else ca
+    adcs = unique(adcs)
+    values = ca.caget_many([pvname for adc in adcs for pvname in adc_pvs(adc)])
+    return {adc: (float(values[2 * i]), float(values[2 * i + 1])) for i, adc in enumerate(adcs)}
+
+def unique(items):
+    """ returns items without repeats, in order """
+    ret = []
+    for item in items:
+        if item not in ret:
+            ret.append(item)
+    return ret
+
+class ADCMonitor(object):
+    """
+    Keeps the latest adc_min/adc_max values of adcs up to date with channel
+    access monitors instead of a caget per reading
+
+    Each PV's latest (value, arrival time, IOC timestamp) is replaced as a
+    whole by the monitor callback, so readers take a consistent snapshot
+    without locking. A sweep can wait_update() for the first values posted
+    after it changed the power. Freshness is judged by the local arrival time,
+    the IOC's clock may differ from ours.
+
+    Parameters
+    ----------
+    adcs : iterable
+        adc names, e.g. ['adc4', 'adc3']
+
+    ca : module, optional
+        channel access module with camonitor/camonitor_clear (pyepics by
+        default, see simulators.FakeCA)
+    """
+    def __init__(self, adcs, ca=None):
+        self._ca = epics if ca is None else ca
+        self._latest = {}
+        self._updated = threading.Condition()
+        self._pvs = []
+        for adc in adcs:
+            for pvname in adc_pvs(adc):
+                if pvname not in self._pvs:
+                    self._pvs.append(pvname)
+                    self._ca.camonitor(pvname, callback=self._update)
+
+    def _update(self, pvname=None, value=None, timestamp=None, **kwargs):
+        """ monitor callback """
+        self._latest[pvname] = (float(value), time(), timestamp)
+        with self._updated:
+            self._updated.notify_all()
+
+    def snapshot(self, adc):
+        """
+        returns (adc_min, adc_max, arrival) where arrival is the local time the
+        older of the two updates arrived, or None if a value hasn't arrived yet
+        """
+        pv_min, pv_max = adc_pvs(adc)
+        latest_min = self._latest.get(pv_min)
+        latest_max = self._latest.get(pv_max)
+        if latest_min is None or latest_max is None:
+            return None
+        return latest_min[0], latest_max[0], min(latest_min[1], latest_max[1])
+
+    def values(self, adc):
+        """ returns the latest (adc_min, adc_max) like adc_vals """
+        snapshot = self.snapshot(adc)
+        if snapshot is None:
+            return adc_vals(adc, self._ca)
+        return snapshot[:2]
+
+    def wait_update(self, adc, after, timeout=1.0):
+        """
+        waits until both values of adc arrived after local time after and
+        returns them. Returns the latest values (with a warning) on timeout
+        """
+        deadline = time() + timeout
+        with self._updated:
+            snapshot = self.snapshot(adc)
+            while snapshot is None or snapshot[2] <= after:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    warnings.warn("no new {0} values after {1:.1f} s".format(adc, timeout))
+                    return self.values(adc)
+                self._updated.wait(remaining)
+                snapshot = self.snapshot(adc)
+        return snapshot[:2]
+
+    def close(self):
+        """ removes the monitors """
+        for pvname in self._pvs:
+            self._ca.camonitor_clear(pvname)
 
 def which_channel():
     """ command line prompt for choosing channel """
@@ -40,6 +142,19 @@ def which_channel():
 
     return channel
 
+def which_channels(selection):
+    """
+    returns the CHANNELS picked by selection, comma separated channel numbers
+    (as listed by which_channel) or 'all'
+    """
+    if selection.strip().lower() == 'all':
+        return list(CHANNELS)
+    try:
+        return unique(CHANNELS[int(number)] for number in selection.split(','))
+    except (ValueError, IndexError):
+        raise ValueError("invalid channel selection '{0}', use numbers 0-{1:d} or 'all'".format(
+            selection, len(CHANNELS) - 1))
+
 def gen_filename(prefix):
     """ generates filename: channel_name"""
     filename = prefix.replace(' ', '_')
@@ -48,5 +163,3 @@ def gen_filename(prefix):
         filename += '-' + str(currtime[i])
     return filename
 
-
-
@@ -0,0 +1,169 @@
+"""
+batch analysis of every sweep of a channel at once (plot.py does one file at a time)
+
+    batch = load_sweeps(CHANNELS[0])
+    print(batch.summary())
+"""
+from __future__ import print_function
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+
+from adcutils import CHANNELS
+from catalog import Catalog, SATURATED
+from datafile import read_rows
+
+FULL_SCALE = 65536.
+MIN_RANGE = 15
+
+
+class SweepBatch(object):
+    """ sweeps of one channel in (sweeps, points) arrays padded past mask """
+    def __init__(self, filenames, timestamps, inputs, adc_min, adc_max, mask):
+        self.filenames = list(filenames)
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.inputs = inputs
+        self.adc_min = adc_min
+        self.adc_max = adc_max
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def points(self):
+        """ number of points of each sweep """
+        return self.mask.sum(axis=1)
+
+    def measured_power(self):
+        """ (sweeps, points) measured power in dBFS, nan outside of the mask """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            power = 20 * np.log10((self.adc_max - self.adc_min) / FULL_SCALE)
+        return np.where(self.mask, power, np.nan)
+
+    def gains(self):
+        """ (sweeps, points) measured power minus input, nan outside of the mask """
+        return self.measured_power() - self.inputs
+
+    def saturation_index(self):
+        """
+        index of the point where both adc readings saturated in each sweep,
+        -1 for sweeps which didn't saturate (see plot.saturation_point)
+        """
+        adc_min = np.where(self.mask, self.adc_min, np.inf)
+        adc_max = np.where(self.mask, self.adc_max, -np.inf)
+        saturated = (np.abs(adc_min.min(axis=1)) >= SATURATED) & (adc_max.max(axis=1) >= SATURATED)
+        # sweeps are increasing, so the lower input is the lower index
+        index = np.minimum(adc_min.argmin(axis=1), adc_max.argmax(axis=1))
+        return np.where(saturated & self.mask.any(axis=1), index, -1)
+
+    def saturation(self):
+        """ input power at the saturation point of each sweep, nan if it didn't saturate """
+        index = self.saturation_index()
+        rows = np.arange(len(self))
+        return np.where(index >= 0, self.inputs[rows, np.maximum(index, 0)], np.nan)
+
+    def useful(self):
+        """
+        (sweeps, points) mask of the points up to saturation of sweeps which
+        saturate and cover more than MIN_RANGE dBm (see plot.useful_data)
+        """
+        index = self.saturation_index()
+        inputs = np.where(self.mask, self.inputs, np.nan)
+        with warnings.catch_warnings():
+            # sweeps without points reduce to nan
+            warnings.simplefilter('ignore', RuntimeWarning)
+            covers = np.nanmax(inputs, axis=1) - np.nanmin(inputs, axis=1) > MIN_RANGE
+        upto = np.arange(self.mask.shape[1]) <= index[:, np.newaxis]
+        return self.mask & upto & (covers & (index >= 0))[:, np.newaxis]
+
+    def fit(self, mask=None, deg=3):
+        """
+        (sweeps, deg + 1) np.polyfit coefficients of measured power vs input,
+        nan for sweeps with too few points in mask (useful() by default)
+        """
+        mask = self.useful() if mask is None else mask
+        power = np.where(mask, self.measured_power(), 0.0)
+        # scale the inputs to [-1, 1] to keep the normal equations well conditioned
+        scale = np.max(np.where(mask, np.abs(self.inputs), 0.0), axis=1)
+        fittable = mask.sum(axis=1) > deg
+        scale = np.where(fittable & (scale > 0), scale, 1.0)
+        x = np.where(mask, self.inputs / scale[:, np.newaxis], 0.0)
+        vander = x[..., np.newaxis] ** np.arange(deg, -1, -1)
+        vander = vander * mask[..., np.newaxis]
+        lhs = np.einsum('spi,spj->sij', vander, vander)
+        rhs = np.einsum('spi,sp->si', vander, power)
+        lhs[~fittable] = np.eye(deg + 1)
+        coefficients = np.linalg.solve(lhs, rhs[..., np.newaxis])[..., 0]
+        coefficients /= scale[:, np.newaxis] ** np.arange(deg, -1, -1)
+        coefficients[~fittable] = np.nan
+        return coefficients
+
+    def summary(self):
+        """ DataFrame of per sweep results indexed by file name """
+        useful = self.useful()
+        gains = np.where(useful, self.gains(), np.nan)
+        inputs = np.where(self.mask, self.inputs, np.nan)
+        fits = self.fit(useful)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            table = pd.DataFrame({
+                'timestamp': self.timestamps,
+                'points': self.points,
+                'input_min': np.nanmin(inputs, axis=1),
+                'input_max': np.nanmax(inputs, axis=1),
+                'saturation': self.saturation(),
+                'useful': useful.any(axis=1),
+                'gain_mean': np.nanmean(gains, axis=1),
+                'gain_max': np.nanmax(gains, axis=1),
+                'a0': fits[:, 3], 'a1': fits[:, 2], 'a2': fits[:, 1], 'a3': fits[:, 0],
+            }, index=pd.Index(self.filenames, name='filename'))
+        return table
+
+
+def load_sweeps(channel, directory='./data', catalog=None):
+    """
+    returns a SweepBatch of every data file of channel, oldest first
+
+    channel is a name or adcutils.Channel, catalog a catalog.Catalog of
+    directory (updated and closed here if not given)
+    """
+    own_catalog = catalog is None
+    if own_catalog:
+        catalog = Catalog(directory)
+        catalog.update()
+    try:
+        entries = [entry for entry in catalog.find(channel=channel) if entry.points > 0]
+    finally:
+        if own_catalog:
+            catalog.close()
+
+    shape = (len(entries), max([entry.points for entry in entries] or [0]))
+    inputs = np.zeros(shape)
+    adc_min = np.zeros(shape)
+    adc_max = np.zeros(shape)
+    mask = np.zeros(shape, dtype=bool)
+    for i, entry in enumerate(entries):
+        rows = read_rows(os.path.join(directory, entry.filename))
+        points = len(rows)
+        inputs[i, :points] = rows[:, 1]
+        adc_min[i, :points] = rows[:, 2]
+        adc_max[i, :points] = rows[:, 3]
+        mask[i, :points] = True
+    return SweepBatch([entry.filename for entry in entries],
+                      [entry.timestamp for entry in entries], inputs, adc_min, adc_max, mask)
+
+
+def main(directory):
+    """ prints the summary of every channel """
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', None)
+    for channel in CHANNELS:
+        print(channel.name)
+        print(load_sweeps(channel, directory).summary())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'data')
@@ -0,0 +1,102 @@
+"""
+asyncio access to the blocking devices
+
+The device classes in devices.py, bncinst.py and specanalyzer.py talk to one
+instrument at a time. AsyncDevice wraps one of them so a single event loop can
+overlap work on several instruments, e.g. step the generator while the
+analyzer sweeps. Every call runs in a thread owned by the device, so calls on
+the same device never interleave and the framing, Prologix and SCPI code is
+the one in the blocking classes. This takes the place of separate asyncio
+native classes (an AsyncSocketInterface, AsyncBaseDevice and async BNC845 and
+RandSFSP), which would have duplicated that code.
+
+    gen = await open_device(lambda: BNC845(SocketInterface(GEN_ADDR)))
+    spec = await open_device(lambda: RandSFSP(TempPrologixEnetInterface(*SPEC_ADDR)))
+    await asyncio.gather(gen.set_power(-10), spec.take_sweep())
+
+Requires python 3.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDevice(object):
+    """
+    coroutine versions of the methods of a blocking device
+
+    Methods of device become coroutine functions, settings are read and
+    written with get() and set().
+    """
+    def __init__(self, device, executor=None):
+        self.device = device
+        self._executor = executor if executor is not None else ThreadPoolExecutor(max_workers=1)
+
+    async def call(self, function, *args, **kwargs):
+        """ runs function(*args, **kwargs) in the device's thread """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor,
+                                          functools.partial(function, *args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self.device, name)
+        if not callable(method):
+            raise AttributeError("{0} is not a method, use get()".format(name))
+
+        async def call(*args, **kwargs):
+            return await self.call(method, *args, **kwargs)
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    async def get(self, name):
+        """ returns setting name of the device """
+        return await self.call(getattr, self.device, name)
+
+    async def set(self, name, value):
+        """ sets setting name of the device """
+        return await self.call(setattr, self.device, name, value)
+
+    def close(self):
+        """ stops the device's thread """
+        self._executor.shutdown()
+
+
+async def open_device(factory):
+    """ returns an AsyncDevice of factory(), which is called in the device's thread """
+    executor = ThreadPoolExecutor(max_workers=1)
+    device = await asyncio.get_running_loop().run_in_executor(executor, factory)
+    return AsyncDevice(device, executor)
+
+
+def main():
+    """ steps a simulated generator while a simulated analyzer sweeps """
+    from interfaces import SocketInterface, PrologixEnetController
+    from bncinst import BNC845
+    from specanalyzer import RandSFSP
+    from simulators import SimulatorServer, PrologixServer, FakeBNC845, FakeFSP
+
+    async def run(gen_addr, spec_addr):
+        gen = await open_device(lambda: BNC845(SocketInterface(gen_addr)))
+        spec = await open_device(lambda: RandSFSP(
+            PrologixEnetController(spec_addr[0], port=spec_addr[1]).open(18)))
+        for name, concurrent in (("sequential", False), ("concurrent", True)):
+            start = time.time()
+            for power in range(-30, 1):
+                if concurrent:
+                    await asyncio.gather(gen.set_power(power), spec.take_sweep())
+                else:
+                    await gen.set_power(power)
+                    await spec.take_sweep()
+            print("{0:<12}{1:>7.3f} s".format(name, time.time() - start))
+        gen.close()
+        spec.close()
+
+    with SimulatorServer(FakeBNC845(), latency=.005) as gen_server, \
+         PrologixServer({18: FakeFSP()}, latency=.01) as spec_server:
+        asyncio.run(run(gen_server.address, spec_server.address))
+
+
+if __name__ == '__main__':
+    main()
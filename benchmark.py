@@ -0,0 +1,175 @@
+"""
+end to end benchmarks of llrfprof against the simulator farm
+
+Each scenario runs llrfprof's measure_channels or profile against a
+simulators.SimulatorFarm (in a scratch directory, so data/ and gain_files/
+are untouched) and reports points per second, round trips per point and the
+median and 99th percentile query latency. Results are appended to
+benchmarks/results.jsonl with the git revision so runs can be compared.
+
+    python benchmark.py measure profile --latency .002
+    python benchmark.py measure -- --settle threshold --monitor
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+from time import time
+import numpy as np
+
+import adcutils
+import llrfprof
+from adcutils import CHANNELS
+from simulators import SimulatorFarm
+from tracing import Tracer
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'results.jsonl')
+SCENARIOS = ('measure', 'channels', 'profile')
+
+
+def llrfprof_args(scenario, options, extra, farm):
+    """ returns llrfprof's arguments for scenario on farm """
+    if scenario == 'profile':
+        argv = [str(llrfprof.GEN_MIN), str(options.profile_max), '--profile',
+                '--gain-file', 'profile.gain']
+    else:
+        argv = [str(options.min), str(options.max), '-p', str(options.points)]
+    if scenario == 'channels':
+        argv += ['--channels', options.channels]
+    gpib_addr, (host, port) = farm.spec_addr
+    argv += ['--gen-addr', '{0}:{1:d}'.format(*farm.gen_addr),
+             '--spec-addr', '{0:d}@{1}:{2:d}'.format(gpib_addr, host, port)]
+    return llrfprof.build_parser().parse_args(argv + ['--yes'] + extra)
+
+
+def run_scenario(scenario, options, extra):
+    """ runs scenario on a fresh simulator farm, returns its metrics """
+    channel = CHANNELS[options.channel]
+    fsp_offset = llrfprof.fsp_attenuation(channel) if scenario == 'profile' else 0.0
+    workdir = tempfile.mkdtemp(prefix='llrfbench')
+    os.mkdir(os.path.join(workdir, 'data'))
+    cwd, stdout = os.getcwd(), sys.stdout
+    tracer = Tracer(capacity=1 << 20)
+    with SimulatorFarm(channel.gain_file, latency=options.latency, jitter=options.jitter,
+                       ca_period=options.ca_period, fsp_offset=fsp_offset) as farm:
+        args = llrfprof_args(scenario, options, extra, farm)
+        try:
+            os.chdir(workdir)
+            sys.stdout = open(os.devnull, 'w')
+            start = time()
+            if scenario == 'profile':
+                points = llrfprof.profile(args, channel, tracer)
+            else:
+                channels = adcutils.which_channels(args.channels) if args.channels else [channel]
+                llrfprof.measure_channels(args, channels, tracer=tracer, ca=farm.ca)
+                points = args.points
+            elapsed = time() - start
+            counts = farm.counts()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            os.chdir(cwd)
+            shutil.rmtree(workdir)
+            llrfprof.SESSIONS.close_all()
+            if options.trace:
+                tracer.export_chrome_trace(options.trace.format(scenario=scenario))
+
+    round_trips = counts['gen_round_trips'] + counts['spec_round_trips']
+    queries = tracer.durations('.query')
+    latencies = (queries if len(queries) else np.array([np.nan])) * 1E3
+    metrics = {'elapsed': elapsed, 'points': points, 'points_per_sec': points / elapsed,
+               'round_trips_per_point': round_trips / float(points), 'queries': len(queries),
+               'query_p50_ms': float(np.percentile(latencies, 50)),
+               'query_p99_ms': float(np.percentile(latencies, 99))}
+    metrics.update(counts)
+    return metrics
+
+
+def git_revision():
+    """ returns the short revision of the checkout, None if it isn't known """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(filename=RESULTS):
+    """ returns every stored result, oldest first """
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+
+def save_result(result, filename=RESULTS):
+    """ appends result to filename """
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    with open(filename, 'a') as results_file:
+        results_file.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+def report(result, previous=None):
+    """ prints result, with the change from previous if given """
+    print("{0} @ {1}".format(result['scenario'], result['revision']))
+    if 'error' in result:
+        print("  failed: " + result['error'])
+        return
+    for name in ('points_per_sec', 'round_trips_per_point', 'query_p50_ms', 'query_p99_ms',
+                 'elapsed'):
+        line = "  {0:<24}{1:>10.3f}".format(name, result['metrics'][name])
+        if previous is not None and 'metrics' in previous and previous['metrics'][name]:
+            change = result['metrics'][name] / previous['metrics'][name] - 1
+            line += "  {0:+7.1%} vs {1}".format(change, previous['revision'])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark llrfprof on simulated instruments",
+                                     epilog="arguments after -- are passed to llrfprof")
+    parser.add_argument("scenarios", nargs='*', choices=SCENARIOS, default=['measure'])
+    parser.add_argument("--channel", type=int, default=0, help="Index in adcutils.CHANNELS")
+    parser.add_argument("--channels", default='0,1,2', help="Channels of the channels scenario")
+    parser.add_argument("--min", type=float, default=10.0, help="Min real power of measure")
+    parser.add_argument("--max", type=float, default=25.0, help="Max real power of measure")
+    parser.add_argument("--profile-max", type=float, default=0.0, help="Max raw power of profile")
+    parser.add_argument("-p", "--points", type=int, default=21)
+    parser.add_argument("--latency", type=float, default=.002, help="Instrument latency (s)")
+    parser.add_argument("--jitter", type=float, default=.001, help="Random extra latency (s)")
+    parser.add_argument("--ca-period", type=float, default=.1, help="adc monitor period (s)")
+    parser.add_argument("--results", default=RESULTS, help="File results are appended to")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a Chrome trace of each scenario, {scenario} is replaced")
+    parser.add_argument("--no-save", action="store_true", help="Don't store the results")
+    argv = sys.argv[1:] if argv is None else argv
+    extra = argv[argv.index('--') + 1:] if '--' in argv else []
+    options = parser.parse_args(argv[:len(argv) - len(extra) - 1] if extra or '--' in argv
+                                else argv)
+
+    config = {name: getattr(options, name) for name in ('channel', 'channels', 'min', 'max',
+                                                        'profile_max', 'points', 'latency',
+                                                        'jitter', 'ca_period')}
+    config['llrfprof'] = extra
+    history = load_results(options.results)
+    for scenario in options.scenarios:
+        result = {'scenario': scenario, 'time': time(), 'revision': git_revision(),
+                  'config': config}
+        try:
+            result['metrics'] = run_scenario(scenario, options, extra)
+        except Exception as err: # pylint: disable=broad-except
+            result['error'] = "{0}: {1}".format(type(err).__name__, err)
+        previous = [old for old in history
+                    if old['scenario'] == scenario and old['config'] == config]
+        report(result, previous[-1] if previous else None)
+        if not options.no_save:
+            save_result(result, options.results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 """ contains methods to interface with signal generators """
-from signalgenerator import SignalGenerator
+from devices import cached_setting
+from signalgenerator import SignalGenerator, SweepPlan, SweepReport
+from settle import FixedSettle
 
 MHZ = 1E6
 
@@ -17,7 +19,7 @@ class BNC845(SignalGenerator):
     (https://www.berkeleynucleonics.com/microwave-signal-generators)
     """
 
-    @property
+    @cached_setting
     def raw_frequency(self):
         return self.get_freq()
 
@@ -26,19 +28,28 @@ class BNC845(SignalGenerator):
         self.set_freq(value / 1E6)
 
 
-    def set_freq(self, new_freq, check=True):
+    def set_freq(self, new_freq, check=None):
         """
         sets frequency to freq (MHZ)
-        if check is True then asks instrument if frequency was properly set
+        if check is True then asks instrument if frequency was properly set,
+        if None the verify policy decides
         Error to pass no frequency
-        Raise ValueSetException if frequency could not be set
+        Raise ValueSetException if frequency could not be set (recorded in the
+        sweep report instead during a sweep)
         """
         assert new_freq is not None
-        self.write(':FREQ ' + str(new_freq) + 'MHZ')
-
-        if check and abs(self.get_freq() / MHZ - new_freq) > 1E-5:
-            raise ValueSetException(
-                "Frequency could not be set {0:>.2}".format(new_freq))
+        self.invalidate('raw_frequency')
+        check = self.should_verify('frequency') if check is None else check
+        if not check:
+            self.write(':FREQ ' + str(new_freq) + 'MHZ')
+            return
+
+        with self.batch():
+            self.write(':FREQ ' + str(new_freq) + 'MHZ')
+            freq = self.get_freq()
+        if abs(freq / MHZ - new_freq) > 1E-5:
+            self.value_set_failed(ValueSetException(
+                "Frequency could not be set {0:>.2}".format(new_freq)))
 
     def get_freq(self):
         """ returns the frequency on the front panel of the instrument in MHZ """
@@ -53,25 +64,33 @@ class BNC845(SignalGenerator):
         self.set_power(value)
 
 
-    def set_power(self, new_power, check=True):
+    def set_power(self, new_power, check=None):
         """
         set power to power in dbm
-        if check is True then asks instrument if power was properly set
+        if check is True then asks instrument if power was properly set,
+        if None the verify policy decides
         Error to pass no power
-        Raise ValueSetException if power could not be set
+        Raise ValueSetException if power could not be set (recorded in the
+        sweep report instead during a sweep)
         """
         assert new_power is not None
-        self.write(':POW ' + str(new_power))
-
-        if check and abs(self.get_power() - new_power) > 1E-5:
-            raise ValueSetException(
-                "Power could not be set {0:>.2}".format(new_power))
+        check = self.should_verify('power') if check is None else check
+        if not check:
+            self.write(':POW ' + str(new_power))
+            return
+
+        with self.batch():
+            self.write(':POW ' + str(new_power))
+            power = self.get_power()
+        if abs(power - new_power) > 1E-5:
+            self.value_set_failed(ValueSetException(
+                "Power could not be set {0:>.2}".format(new_power)))
 
     def get_power(self):
         """ returns the power on the front panel of the instrument in dbm """
         return float(self.query(':POW?'))
 
-    @property
+    @cached_setting
     def signal_on(self):
         return bool(int(self.query(":OUTP?")))
 
@@ -85,7 +104,110 @@ class BNC845(SignalGenerator):
     def rf_on(self):
         """ Tells instrument to turn on rf signal """
         self.write(':OUTP ON')
+        self.settings_cache['signal_on'] = True
 
     def rf_off(self):
         """ Tells instrument to turn off rf signal """
         self.write(':OUTP OFF')
+        self.settings_cache['signal_on'] = False
+
+    def load_power_list(self, raw_powers, dwell=None, trigger='BUS', check=True):
+        """
+        uploads raw_powers (dbm) as the power list in a single transfer and
+        switches power to list mode. The list starts with start_list()
+
+        dwell is the time at each point in seconds. trigger is the step
+        source: 'BUS' steps on each trigger(), 'IMM' steps every dwell seconds,
+        'EXT' on the external trigger input
+        if check is True then reads the list back once
+        Raise ValueSetException if the list could not be set
+        """
+        cmds = [':LIST:POW ' + ','.join(str(power) for power in raw_powers)]
+        if dwell is not None:
+            cmds.append(':LIST:DWEL ' + str(dwell))
+        cmds += [':LIST:TRIG:SOUR ' + trigger, ':POW:MODE LIST']
+        self.write(';'.join(cmds))
+
+        if check:
+            readback = [float(power) for power in self.query(':LIST:POW?').split(',')]
+            if len(readback) != len(raw_powers) or \
+               any(abs(got - power) > 1E-5 for got, power in zip(readback, raw_powers)):
+                raise ValueSetException("Power list could not be set")
+
+    def start_list(self):
+        """ starts the loaded list at its first point """
+        self.write(':INIT')
+
+    def trigger(self):
+        """ steps a BUS triggered list to its next point """
+        self.write('*TRG')
+
+    def stop_list(self):
+        """ returns power to fixed (non list) mode """
+        self.write(':POW:MODE FIX')
+
+    def list_sweep(self, output_powers, callback, state=None, delay=0, settle=None,
+                   verify=None):
+        """
+        like power_sweep, but the whole schedule is uploaded as a BUS triggered
+        power list and each point costs one '*TRG' write instead of a set and
+        a verifying query. The list is read back once when it is loaded
+        (unless verify is 'none' or 'deferred') and the final power once at
+        the end. Returns a SweepReport
+        """
+        plan = output_powers
+        if not isinstance(plan, SweepPlan):
+            plan = SweepPlan(self, output_powers, delay)
+        if settle is None:
+            settle = FixedSettle(plan.delay, plan.rf_settle)
+        settle.reset()
+
+        with self.verifying(verify):
+            with self.batch():
+                self.signal_on = False
+                self.start_sweep()
+                self.load_power_list(plan.raws.tolist(), trigger='BUS',
+                                     check=self.verify in ('always', 'sampled'))
+
+            self._report = report = SweepReport(plan, settle)
+            try:
+                self.start_list()
+                self.signal_on = True
+                settle.rf_on()
+
+                for i, (raw, power) in enumerate(plan):
+                    if i > 0:
+                        self.trigger()
+                    settle.point()
+                    callback(raw, power, state)
+                    report.points += 1
+
+                if self.verify != 'none' and abs(self.get_power() - plan.raws[-1]) > 1E-5:
+                    self.value_set_failed(ValueSetException(
+                        "List sweep did not reach its last point"))
+            finally:
+                self._report = None
+                self.signal_on = False
+                self.stop_list()
+
+            self.verify_sweep(report)
+        return report
+
+    def start_sweep(self):
+        """ with the 'deferred' policy, clears errors queued before the sweep """
+        if self.verify == 'deferred':
+            self.write('*CLS')
+
+    def verify_sweep(self, report):
+        """ with the 'deferred' policy, adds the error queue to report """
+        if self.verify != 'deferred':
+            return
+        code, msg = self.syst_err()
+        while code != 0:
+            report.errors.append((code, msg))
+            code, msg = self.syst_err()
+
+    def syst_err(self):
+        """ queries system err queue and returns result """
+        err = self.query(":SYST:ERR?").split(',', 1)
+        return int(err[0]), err[1].strip().strip('"')
@@ -0,0 +1,250 @@
+"""
+SQLite catalog of the measurement files in data/
+
+Each data file (text or sweep file) gets one row with its channel, the time
+parsed from its adcutils.gen_filename suffix, point count, input range,
+saturation point and gain file. update() only reads files which are new or
+changed since they were cataloged, and lookups use indexes instead of
+listing the directory.
+
+    catalog = Catalog('data')
+    catalog.update()
+    catalog.latest('Cavity Cell Voltage')
+    catalog.find(channel='REV Cavity', min_range=15, saturated=True)
+"""
+from __future__ import print_function
+import os
+import sys
+import sqlite3
+from time import mktime
+from collections import namedtuple
+import numpy as np
+
+from adcutils import CHANNELS
+from datafile import (EXTENSION, CHECKPOINT_EXTENSION, TEMP_EXTENSION, is_sweep_file,
+                      read_sweep, read_rows)
+
+CATALOG = 'catalog.db'
+SATURATED = 32764
+
+Entry = namedtuple('Entry', ['filename', 'channel', 'timestamp', 'points', 'input_min',
+                             'input_max', 'saturation', 'gain_file', 'complete'])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    filename TEXT PRIMARY KEY,
+    channel TEXT,
+    timestamp REAL,
+    points INTEGER,
+    input_min REAL,
+    input_max REAL,
+    saturation REAL,
+    gain_file TEXT,
+    complete INTEGER,
+    mtime REAL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS measurements_channel ON measurements (channel, timestamp);
+CREATE INDEX IF NOT EXISTS measurements_range ON measurements (input_max - input_min);
+"""
+
+
+def parse_timestamp(filename):
+    """ returns the time in the gen_filename suffix of filename, None if it has none """
+    if filename.endswith(EXTENSION):
+        filename = filename[:-len(EXTENSION)]
+    fields = os.path.basename(filename).split('-')
+    if len(fields) < 6:
+        return None
+    try:
+        year, month, day, hour, minute = [int(field) for field in fields[-5:]]
+    except ValueError:
+        return None
+    return mktime((year, month, day, hour, minute, 0, 0, 0, -1))
+
+
+def saturation_input(real_inputs, adc_min, adc_max):
+    """
+    returns the input at which both adc readings saturated, None if they
+    didn't (see plot.saturation_point)
+    """
+    if len(real_inputs) == 0:
+        return None
+    if abs(adc_min.min()) < SATURATED or adc_max.max() < SATURATED:
+        return None
+    return float(min(real_inputs[np.argmin(adc_min)], real_inputs[np.argmax(adc_max)]))
+
+
+def channel_of(filename):
+    """ returns the channel whose data files start like filename, None if none does """
+    for channel in CHANNELS:
+        if os.path.basename(filename).startswith(channel.name.replace(' ', '_') + '-'):
+            return channel
+    return None
+
+
+def read_entry(path):
+    """ returns the Entry of a data file """
+    filename = os.path.basename(path)
+    channel = channel_of(filename)
+    header = {}
+    if os.path.getsize(path) > 0 and is_sweep_file(path):
+        header, rows = read_sweep(path)
+    else:
+        rows = read_rows(path)
+    points = len(rows)
+    expected = header.get('sweep', {}).get('points')
+    complete = (points > 0 and not os.path.exists(path + CHECKPOINT_EXTENSION) and
+                (expected is None or points >= expected))
+    timestamp = parse_timestamp(filename)
+    if timestamp is None:
+        timestamp = header.get('started', os.path.getmtime(path))
+    gain_file = header.get('gain_file', channel.gain_file if channel is not None else None)
+    return Entry(filename=filename,
+                 channel=header.get('channel', channel.name if channel is not None else None),
+                 timestamp=timestamp, points=points,
+                 input_min=float(rows[:, 1].min()) if points else None,
+                 input_max=float(rows[:, 1].max()) if points else None,
+                 saturation=saturation_input(rows[:, 1], rows[:, 2], rows[:, 3]) if points else None,
+                 gain_file=gain_file, complete=complete)
+
+
+class Catalog(object):
+    """
+    index of the data files in directory
+
+    Parameters
+    ----------
+    directory : str, optional
+        directory holding the data files
+
+    path : str, optional
+        SQLite database, CATALOG in directory by default
+    """
+    def __init__(self, directory='./data', path=None):
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOG) if path is None else path
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+
+    def update(self):
+        """
+        catalogs new and changed data files and drops deleted ones, returns the
+        number of files read
+        """
+        known = {row[0]: (row[1], row[2]) for row in
+                 self.connection.execute("SELECT filename, mtime, size FROM measurements")}
+        filenames = set(filename for filename in os.listdir(self.directory)
+                        if channel_of(filename) is not None and
+                        not filename.endswith((CHECKPOINT_EXTENSION, TEMP_EXTENSION)))
+        # text files already converted by datafile.py are cataloged as their sweep file
+        filenames -= set(filename[:-len(EXTENSION)] for filename in filenames
+                         if filename.endswith(EXTENSION))
+        read = 0
+        with self.connection:
+            for filename in filenames:
+                path = os.path.join(self.directory, filename)
+                stat = os.stat(path)
+                stamp = (stat.st_mtime, stat.st_size)
+                # a checkpoint next to the file means the sweep may still be running
+                if known.get(filename) == stamp and not os.path.exists(path + CHECKPOINT_EXTENSION):
+                    continue
+                try:
+                    entry = read_entry(path)
+                except ValueError as err:
+                    print(filename + ' skipped: ' + str(err))
+                    continue
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO measurements VALUES "
+                    "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry.filename, entry.channel, entry.timestamp,
+                     entry.points, entry.input_min, entry.input_max, entry.saturation,
+                     entry.gain_file, int(entry.complete)) + stamp)
+                read += 1
+            self.connection.executemany("DELETE FROM measurements WHERE filename = ?",
+                                        [(filename,) for filename in known
+                                         if filename not in filenames])
+        return read
+
+    def _select(self, where, params, order="timestamp", limit=None):
+        """ returns the Entries matching where """
+        query = ("SELECT " + ", ".join(Entry._fields) + " FROM measurements" +
+                 (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY " + order)
+        if limit is not None:
+            query += " LIMIT {0:d}".format(limit)
+        return [Entry(*row[:-1] + (bool(row[-1]),))
+                for row in self.connection.execute(query, params)]
+
+    def latest(self, channel=None, complete=True, prefix=None):
+        """
+        returns the newest Entry of channel (a name or adcutils.Channel) or of
+        files starting with prefix, None if there is none
+        """
+        where, params = [], []
+        if channel is not None:
+            where.append("channel = ?")
+            params.append(getattr(channel, 'name', channel))
+        if prefix is not None:
+            # a range on the primary key instead of LIKE, where _ is a wildcard
+            where.append("filename >= ? AND filename < ?")
+            params.extend([prefix, prefix + u'\uffff'])
+        if complete:
+            where.append("complete = 1")
+        entries = self._select(where, params, order="timestamp DESC", limit=1)
+        return entries[0] if entries else None
+
+    def find(self, channel=None, min_range=None, saturated=None, complete=None, since=None):
+        """
+        returns the Entries matching every given condition, oldest first
+
+        Parameters
+        ----------
+        channel : str or adcutils.Channel, optional
+        min_range : float, optional
+            smallest input range covered, in dBm
+        saturated : bool, optional
+            whether the sweep reached saturation
+        complete : bool, optional
+        since : float, optional
+            earliest timestamp
+        """
+        where, params = [], []
+        if channel is not None:
+            where.append("channel = ?")
+            params.append(getattr(channel, 'name', channel))
+        if min_range is not None:
+            where.append("input_max - input_min >= ?")
+            params.append(min_range)
+        if saturated is not None:
+            where.append("saturation IS NOT NULL" if saturated else "saturation IS NULL")
+        if complete is not None:
+            where.append("complete = ?")
+            params.append(int(complete))
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        return self._select(where, params)
+
+    def close(self):
+        """ closes the database """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(directory):
+    """ updates the catalog of directory and lists it """
+    with Catalog(directory) as catalog:
+        print("{0:d} files read".format(catalog.update()))
+        for entry in catalog.find():
+            print("{0:<45}{1:>4d} points {2:>8} saturation {3}".format(
+                entry.filename, entry.points, "complete" if entry.complete else "partial",
+                entry.saturation))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'data')
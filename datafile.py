@@ -0,0 +1,348 @@
+"""
+append-only binary sweep files
+
+A sweep file is a magic string, a JSON header (channel, gain file, frequency,
+start time, sweep parameters and column names) and then fixed-size rows of
+little-endian float64 values, one per point:
+
+    MAGIC | header length (uint32) | JSON header, padded | rows...
+
+Rows are only ever appended, so the point count follows from the file size
+and a sweep cut short still reads up to its last complete row. Reading memory
+maps the rows instead of parsing text.
+
+    with SweepWriter('data/name.sweep', channel='REV Cavity') as writer:
+        writer.write(raw_power, real_power, adc_min, adc_max)
+    header, rows = read_sweep('data/name.sweep')
+
+A Journal keeps the writers of a sweep and a checkpoint sidecar in step:
+every few points the rows are fsynced and then the checkpoint records how
+many points are complete, so an interrupted sweep can be resumed from there.
+
+python datafile.py [files or directories] converts the old whitespace text
+files (data/ by default) into sweep files next to them.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import struct
+from time import time
+import numpy as np
+
+MAGIC = b'LLRFSWP1'
+EXTENSION = '.sweep'
+CHECKPOINT_EXTENSION = '.ckpt'
+TEMP_EXTENSION = '.tmp'
+COLUMNS = ('raw_input', 'real_input', 'adc_min', 'adc_max')
+ROW_DTYPE = np.dtype('<f8')
+ROW_FORMAT = " ".join(["{" + str(i) + ":>10f}" for i in range(4)]) + '\n'
+
+
+def is_sweep_file(filename):
+    """ returns True if filename starts with the sweep file magic """
+    with open(filename, 'rb') as sweep_file:
+        return sweep_file.read(len(MAGIC)) == MAGIC
+
+
+def read_header(sweep_file):
+    """ returns (header, data offset) of an open sweep file """
+    start = sweep_file.read(len(MAGIC) + 4)
+    if len(start) < len(MAGIC) + 4 or start[:len(MAGIC)] != MAGIC:
+        raise ValueError("{0} is not a sweep file".format(sweep_file.name))
+    length, = struct.unpack('<I', start[len(MAGIC):])
+    header = json.loads(sweep_file.read(length).decode('utf-8'))
+    return header, len(MAGIC) + 4 + length
+
+
+def read_sweep(filename, mmap=True):
+    """
+    returns (header, rows) of a sweep file
+
+    rows is a (points, columns) float64 array, memory mapped read-only if mmap
+    is True. A trailing partial row (from an interrupted write) is ignored.
+    """
+    with open(filename, 'rb') as sweep_file:
+        header, offset = read_header(sweep_file)
+    columns = len(header['columns'])
+    points = (os.path.getsize(filename) - offset) // (columns * ROW_DTYPE.itemsize)
+    if points == 0:
+        return header, np.empty((0, columns), dtype=ROW_DTYPE)
+    if mmap:
+        rows = np.memmap(filename, dtype=ROW_DTYPE, mode='r', offset=offset,
+                         shape=(points, columns))
+    else:
+        with open(filename, 'rb') as sweep_file:
+            sweep_file.seek(offset)
+            rows = np.fromfile(sweep_file, dtype=ROW_DTYPE, count=points * columns)
+        rows = rows.reshape(points, columns)
+    return header, rows
+
+
+def read_rows(filename):
+    """ returns the (points, columns) rows of a sweep file or old text file """
+    if os.path.getsize(filename) == 0:
+        return np.empty((0, len(COLUMNS)))
+    if is_sweep_file(filename):
+        return read_sweep(filename)[1]
+    return np.loadtxt(filename, ndmin=2)
+
+
+class SweepWriter(object):
+    """
+    streams points to a sweep file
+
+    Parameters
+    ----------
+    filename : str
+        file to create (or append to if it's already a sweep file)
+
+    columns : sequence of str, optional
+        names of the values in each row
+
+    buffer_points : int, optional
+        rows kept in memory before they are written to the file
+
+    header :
+        extra header entries, e.g. channel, gain_file, frequency, sweep
+        (started defaults to the current time)
+    """
+    def __init__(self, filename, columns=COLUMNS, buffer_points=32, **header):
+        self.filename = filename
+        self.buffer_points = buffer_points
+        self._buffer = bytearray()
+        self._buffered = 0
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            self._file = open(filename, 'r+b')
+            self.header, self._offset = read_header(self._file)
+            self._row = struct.Struct('<' + 'd' * len(self.header['columns']))
+            # drop a partial row left by an interrupted write
+            self.truncate((os.path.getsize(filename) - self._offset) // self._row.size)
+        else:
+            self.header = dict(header, columns=list(columns))
+            self.header.setdefault('started', time())
+            self.points = 0
+            self._file = open(filename, 'wb')
+            self._file.write(pack_header(self.header))
+            self._offset = self._file.tell()
+            self._row = struct.Struct('<' + 'd' * len(self.header['columns']))
+
+    def write(self, *values):
+        """ appends one row """
+        self._buffer += self._row.pack(*values)
+        self._buffered += 1
+        self.points += 1
+        if self._buffered >= self.buffer_points:
+            self.flush()
+
+    def flush(self):
+        """ writes buffered rows to the file """
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+            self._buffered = 0
+        self._file.flush()
+
+    def sync(self):
+        """ flushes and waits until the rows are on disk """
+        self.flush()
+        os.fsync(self._file.fileno())
+
+    def truncate(self, points):
+        """ drops every row after the first points """
+        self.flush()
+        self._file.truncate(self._offset + points * self._row.size)
+        self._file.seek(0, os.SEEK_END)
+        self.points = points
+
+    def close(self):
+        """ flushes and closes the file """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextWriter(object):
+    """ SweepWriter interface for the old whitespace text files """
+    def __init__(self, filename, columns=COLUMNS, **header):
+        self.filename = filename
+        self.header = dict(header, columns=list(columns))
+        self._file = open(filename, 'a+')
+        self._file.seek(0)
+        self.points = sum(1 for line in self._file if line.strip())
+
+    def write(self, *values):
+        """ appends one row """
+        self._file.write(ROW_FORMAT.format(*values))
+        self.points += 1
+
+    def flush(self):
+        """ flushes the file """
+        self._file.flush()
+
+    def sync(self):
+        """ flushes and waits until the rows are on disk """
+        self.flush()
+        os.fsync(self._file.fileno())
+
+    def truncate(self, points):
+        """ drops every row after the first points """
+        self._file.seek(0)
+        lines = [line for line in self._file if line.strip()][:points]
+        self._file.close()
+        with open(self.filename, 'w') as text_file:
+            text_file.writelines(lines)
+        self._file = open(self.filename, 'a+')
+        self.points = len(lines)
+
+    def close(self):
+        """ closes the file """
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Journal(object):
+    """
+    writes the checkpoint of a sweep as its points are completed
+
+    Parameters
+    ----------
+    writers : list
+        SweepWriter or TextWriter of each data file of the sweep
+
+    state : dict, optional
+        saved in the checkpoint, whatever is needed to restart the sweep
+
+    sync_points : int, optional
+        points between fsyncs of the data files and checkpoint updates
+
+    checkpoint : str, optional
+        checkpoint file, the first data file + CHECKPOINT_EXTENSION by default
+    """
+    def __init__(self, writers, state=None, sync_points=10, checkpoint=None):
+        self.writers = writers
+        self.state = state if state is not None else {}
+        self.sync_points = sync_points
+        if checkpoint is None:
+            checkpoint = writers[0].filename + CHECKPOINT_EXTENSION
+        self.checkpoint = checkpoint
+        self.points = min(writer.points for writer in writers)
+        self._pending = 0
+
+    def point_done(self):
+        """ records that every writer has the row of the next point """
+        self.points += 1
+        self._pending += 1
+        if self._pending >= self.sync_points:
+            self.sync()
+
+    def sync(self):
+        """ syncs the data files, then updates the checkpoint """
+        for writer in self.writers:
+            writer.sync()
+        save_json(self.checkpoint, dict(self.state, points=self.points,
+                                        files=[writer.filename for writer in self.writers]))
+        self._pending = 0
+
+    def close(self, complete=False):
+        """ syncs and closes the writers, removing the checkpoint if complete """
+        try:
+            self.sync()
+        finally:
+            for writer in self.writers:
+                writer.close()
+        if complete:
+            os.remove(self.checkpoint)
+
+
+def save_json(filename, obj):
+    """ atomically replaces filename with obj as JSON """
+    # a hidden name, so a leftover temp file is never taken for a data file
+    directory, name = os.path.split(filename)
+    temp = os.path.join(directory, '.' + name + TEMP_EXTENSION)
+    with open(temp, 'w') as json_file:
+        json.dump(obj, json_file, sort_keys=True)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    getattr(os, 'replace', os.rename)(temp, filename)
+
+
+def load_checkpoint(filename):
+    """ returns the checkpoint of filename, a checkpoint or a data file """
+    if not filename.endswith(CHECKPOINT_EXTENSION):
+        filename += CHECKPOINT_EXTENSION
+    with open(filename) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def open_writer(filename):
+    """ reopens a data file written by SweepWriter or TextWriter to append """
+    if filename.endswith(EXTENSION):
+        return SweepWriter(filename)
+    return TextWriter(filename)
+
+
+def pack_header(header):
+    """ returns magic, length and JSON header padded so rows are 8 byte aligned """
+    data = json.dumps(header, sort_keys=True).encode('utf-8')
+    data += b' ' * (-(len(MAGIC) + 4 + len(data)) % ROW_DTYPE.itemsize)
+    return MAGIC + struct.pack('<I', len(data)) + data
+
+
+def convert_text(filename, out=None, **header):
+    """
+    converts a whitespace text data file to a sweep file, returns its name
+
+    the channel is taken from the file name (see adcutils.gen_filename)
+    unless given in header
+    """
+    from adcutils import CHANNELS
+    out = filename + EXTENSION if out is None else out
+    rows = np.loadtxt(filename, ndmin=2) if os.path.getsize(filename) else np.empty((0, 4))
+    prefix = os.path.basename(filename).split('-')[0]
+    for channel in CHANNELS:
+        if channel.name.replace(' ', '_') == prefix:
+            header.setdefault('channel', channel.name)
+            header.setdefault('adc', channel.adc)
+            header.setdefault('gain_file', channel.gain_file)
+    header.setdefault('converted_from', os.path.basename(filename))
+    header.setdefault('started', os.path.getmtime(filename))
+    if os.path.exists(out):
+        os.remove(out)
+    with SweepWriter(out, columns=COLUMNS[:rows.shape[1]], **header) as writer:
+        for row in rows:
+            writer.write(*row)
+    return out
+
+
+def main(paths):
+    """ converts every text data file in paths (files or directories) """
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = sorted(os.path.join(path, name) for name in os.listdir(path))
+        else:
+            filenames = [path]
+        for filename in filenames:
+            if (filename.endswith((EXTENSION, CHECKPOINT_EXTENSION, TEMP_EXTENSION)) or
+                    os.path.basename(filename).startswith('.') or
+                    not os.path.isfile(filename) or is_sweep_file(filename)):
+                continue
+            try:
+                print(filename + ' -> ' + convert_text(filename))
+            except ValueError as err:
+                print(filename + ' skipped: ' + str(err))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or ['data'])
@@ -4,9 +4,68 @@ to implement specific devices
 """
 import warnings
 import time
+from contextlib import contextmanager
 from interfaces import BaseInterface, check_interface
 
 
+class cached_setting(property):
+    """
+    property for an instrument setting which is cached on the device
+
+    The getter only asks the instrument when the setting isn't cached, the
+    setter records the value it sets. The cache is cleared by rst(), by I/O
+    errors and by BaseDevice.invalidate(). Use cached_setting(volatile=True)
+    for settings the instrument can change on its own, they are never cached.
+
+    @cached_setting
+    def span(self):
+        return float(self.query("FREQ:SPAN?"))
+
+    @span.setter
+    def span(self, value):
+        self.write("FREQ:SPAN {0:.2f}Hz".format(value))
+    """
+    def __init__(self, fget=None, fset=None, fdel=None, doc=None, volatile=False):
+        if fget is None and fset is None and fdel is None:
+            # used as @cached_setting(volatile=...)
+            self.volatile = volatile
+            return
+        super(cached_setting, self).__init__(fget, fset, fdel, doc or fget.__doc__)
+        self.volatile = volatile
+        self.name = fget.__name__
+
+    def __call__(self, fget):
+        return type(self)(fget, volatile=self.volatile)
+
+    def __get__(self, device, owner=None):
+        if device is None:
+            return self
+        if self.volatile:
+            return self.fget(device)
+        cache = device.settings_cache
+        if self.name not in cache:
+            cache[self.name] = self.fget(device)
+        return cache[self.name]
+
+    def __set__(self, device, value):
+        if self.fset is None:
+            raise AttributeError("can't set attribute")
+        device.invalidate(self.name)
+        generation = device.cache_generation
+        self.fset(device, value)
+        # a failed set clears the whole cache (see value_set_failed), keep it clear
+        if not self.volatile and device.cache_generation == generation:
+            device.settings_cache[self.name] = value
+
+    def getter(self, fget):
+        return type(self)(fget, self.fset, self.fdel, self.__doc__, self.volatile)
+
+    def setter(self, fset):
+        return type(self)(self.fget, fset, self.fdel, self.__doc__, self.volatile)
+
+    def deleter(self, fdel):
+        return type(self)(self.fget, self.fset, fdel, self.__doc__, self.volatile)
+
 
 class BaseDevice(BaseInterface):
     """
@@ -29,6 +88,29 @@ class BaseDevice(BaseInterface):
 
     query_delay = 0.0
 
+    # messages queued by write() while inside a batch() context
+    _pending = None
+
+    _settings_cache = None
+
+    # counts the times the whole cache was cleared
+    cache_generation = 0
+
+    @property
+    def settings_cache(self):
+        """ dict of cached_setting values known without asking the instrument """
+        if self._settings_cache is None:
+            self._settings_cache = {}
+        return self._settings_cache
+
+    def invalidate(self, name=None):
+        """ forgets the cached value of setting name, or of every setting """
+        if name is None:
+            self.settings_cache.clear()
+            self.cache_generation += 1
+        else:
+            self.settings_cache.pop(name, None)
+
     @property
     def timeout(self):
         """ I/O timeout """
@@ -69,14 +151,30 @@ class BaseDevice(BaseInterface):
 
     def write_raw(self, message):
         """ write message through interface. returns bytes written """
-        return self._interface.write_raw(message)
+        try:
+            return self._interface.write_raw(message)
+        except Exception:
+            # the instrument's state is unknown after a failed write
+            self.invalidate()
+            raise
 
     def write(self, message, termination=None, encoding=None):
         """
         TODO: pyvisa
 
-        write string to device
+        write string to device, or queue it if inside a batch()
         """
+        if self._pending is not None:
+            if termination is None and encoding is None:
+                self._pending.append(message)
+                return 0
+            # sent on its own, so the queued writes have to go first
+            self._flush()
+
+        return self._send(message, termination, encoding)
+
+    def _send(self, message, termination=None, encoding=None):
+        """ terminates, encodes and writes message immediately """
         term = self._write_termination if termination is None else termination
         enco = self._encoding if encoding is None else encoding
 
@@ -89,7 +187,11 @@ class BaseDevice(BaseInterface):
 
     def read_raw(self, size=None):
         """ returns raw data read through interface """
-        return self._interface.read_raw(size)
+        try:
+            return self._interface.read_raw(size)
+        except Exception:
+            self.invalidate()
+            raise
 
     def read(self, termination=None, encoding=None):
         """
@@ -128,17 +230,135 @@ class BaseDevice(BaseInterface):
         :rtype: str
         """
 
-        self.write(message)
+        self._send_query(message, delay)
+        return self.read()
+
+    def query_block(self, message, delay=None):
+        """
+        write(message) and read an IEEE-488.2 definite length block answer
+        (#<n><len><data>)
+
+        :returns: the block's data, without copying it out of the read bytes
+        :rtype: memoryview
+        """
+        self._send_query(message, delay)
+
+        # binary data can contain the termination character, read to EOI
+        # on interfaces which would otherwise stop at it
+        eoi = getattr(self._interface, 'read_eoi', None)
+        if eoi is not None:
+            self._interface.read_eoi = True
+        try:
+            data = self.read_raw()
+        finally:
+            if eoi is not None:
+                self._interface.read_eoi = eoi
+        return parse_block(data)
+
+    def _flush(self):
+        """ sends the writes queued by batch() """
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self._send(";".join(pending))
+
+    def _send_query(self, message, delay=None):
+        """ sends message (after any queued batch writes) and waits delay """
+        if self._pending:
+            # send queued batch writes in the same round trip as the query
+            message = ";".join(self._pending + [message])
+            self._pending = []
+
+        self._send(message)
 
         delay = self.query_delay if delay is None else delay
 
         if delay > 0.0:
             time.sleep(delay)
 
-        return self.read()
+    def query_many(self, messages, delay=None):
+        """
+        Send several queries as one compound command and read all answers in a
+        single round trip
+
+        :param messages: commands to join with ';'. Commands without a query
+                         ('?') are sent but have no answer.
+        :param delay: delay in seconds between write and read operations.
+                      if None, defaults to self.query_delay
+        :returns: list with one entry per message: the answer query(message)
+                  would have returned, or None if message is not a query
+        :rtype: list
+        """
+        counts = [count_queries(message) for message in messages]
+        if not any(counts):
+            self.write(";".join(messages))
+            return [None] * len(messages)
+
+        answers = self.query(";".join(messages), delay).split(";")
+        if len(answers) != sum(counts):
+            raise ValueError("expected {0:d} answers but got {1:d}: {2!r}".format(
+                sum(counts), len(answers), ";".join(answers)))
+
+        ret = []
+        for count in counts:
+            ret.append(";".join(answers[:count]) if count else None)
+            answers = answers[count:]
+        return ret
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager which queues writes and sends them together
+
+        Writes inside the block are joined with ';' and sent with the next
+        query (so a set followed by its check is one round trip) or when the
+        block exits. Batches may be nested, only the outermost one flushes.
+        If the block raises the writes still queued are dropped, not sent.
+
+        with gen.batch():
+            gen.rf_off()
+            gen.set_power(-10)  # ':OUTP OFF;:POW -10;:POW?' in one round trip
+        """
+        outermost = self._pending is None
+        if outermost:
+            self._pending = []
+        try:
+            yield self
+            if outermost:
+                self._flush()
+        finally:
+            if outermost:
+                self._pending = None
 
     def idn(self):
         return self.query("*IDN?")
 
     def rst(self):
         self.write("*RST")
+        self.invalidate()
+
+
+def count_queries(message):
+    """ returns the number of queries ('?' headers) in a compound SCPI message """
+    return sum(1 for cmd in message.split(";") if cmd.strip() and
+               cmd.split()[0].endswith("?"))
+
+
+def parse_block(data):
+    """
+    returns the data of an IEEE-488.2 definite length block (#<n><len><data>)
+    as a memoryview of data
+    """
+    view = memoryview(data)
+    if view[:1].tobytes() != b'#' or not view[1:2].tobytes().isdigit():
+        raise ValueError("answer is not a definite length block: {0!r}".format(
+            view[:16].tobytes()))
+    digits = int(view[1:2].tobytes())
+    if digits == 0:
+        raise ValueError("indefinite length blocks (#0) are not supported")
+    header = view[2:2 + digits].tobytes()
+    if len(header) < digits or not header.isdigit():
+        raise ValueError("bad block length {0!r}".format(header))
+    length = int(header)
+    if len(view) < 2 + digits + length:
+        raise ValueError("block is {0:d} bytes short".format(2 + digits + length - len(view)))
+    return view[2 + digits:2 + digits + length]
@@ -0,0 +1,171 @@
+"""
+gain maps convert between raw (panel) powers and real output powers
+gain files (see gain_files/README.md) hold 'raw gain std [count]' rows
+"""
+import os
+import warnings
+import numpy as np
+
+GAIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gain_files')
+
+_CACHE = {} # (abspath, clip): (mtime, GainMap)
+# measurements assumed per row for gain files without a count column
+DEFAULT_COUNT = 3
+
+
+def resolve_gain_file(filename):
+    """ returns filename, or its path in gain_files/ if it only exists there """
+    if not os.path.exists(filename) and os.path.exists(os.path.join(GAIN_DIR, filename)):
+        return os.path.join(GAIN_DIR, filename)
+    return filename
+
+
+class GainMap(object):
+    """ monotonic mapping between raw powers and real (raw + gain) powers """
+    def __init__(self, raws, gains, filename=None):
+        raws = np.array(raws, dtype=float)
+        reals = raws + np.asarray(gains, dtype=float)
+        if raws.ndim != 1 or raws.size < 2:
+            raise ValueError("gain map needs at least two points")
+        if not np.all(np.diff(raws) > 0):
+            raise ValueError("gain map raw powers are not strictly increasing")
+        if not np.all(np.diff(reals) > 0):
+            bad = raws[1:][np.diff(reals) <= 0]
+            raise ValueError("gain map real powers are not strictly increasing "
+                             "(at raw {0})".format(", ".join(str(raw) for raw in bad)))
+        raws.setflags(write=False)
+        reals.setflags(write=False)
+        self.raws = raws
+        self.reals = reals
+        self.filename = filename
+
+    @classmethod
+    def load(cls, filename, clip=True):
+        """
+        returns the GainMap for filename, parsing it only if it changed
+        with clip the map is cut where the amplifier saturates
+        """
+        path = os.path.abspath(resolve_gain_file(filename))
+        mtime = os.path.getmtime(path)
+        cached = _CACHE.get((path, clip))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        raws, gains = np.loadtxt(path, unpack=True, usecols=[0, 1], ndmin=2)
+        if clip:
+            steps = np.diff(raws + gains) <= 0
+            if np.any(steps):
+                end = int(np.argmax(steps)) + 1
+                warnings.warn("{0} saturates at raw {1}, ignoring {2:d} points above it".format(
+                    filename, raws[end - 1], raws.size - end))
+                raws, gains = raws[:end], gains[:end]
+        gain_map = cls(raws, gains, path)
+        _CACHE[(path, clip)] = (mtime, gain_map)
+        return gain_map
+
+    @property
+    def min_real(self):
+        """ lowest real power in the map """
+        return float(self.reals[0])
+
+    @property
+    def max_real(self):
+        """ highest real power in the map """
+        return float(self.reals[-1])
+
+    def raw_to_real(self, raw_power):
+        """ returns real power(s) for raw power(s) """
+        return _convert(raw_power, self.raws, self.reals)
+
+    def real_to_raw(self, real_power):
+        """ returns raw power(s) for real power(s) """
+        return _convert(real_power, self.reals, self.raws)
+
+
+def _convert(values, xps, fps):
+    """ interpolates values on (xps, fps), float for scalars, raises if out of range """
+    values = np.asarray(values, dtype=float)
+    if np.any((values < xps[0]) | (values > xps[-1])):
+        raise ValueError("power outside gain map range [{0}, {1}]".format(xps[0], xps[-1]))
+    ret = np.interp(values, xps, fps)
+    return float(ret) if ret.ndim == 0 else ret
+
+
+class GainStats(object):
+    """ running mean and std (Welford) of the gain measured at each raw power """
+    def __init__(self):
+        self._points = {} # raw rounded to the gain file precision: [count, mean, m2]
+
+    @classmethod
+    def load(cls, filename, count=DEFAULT_COUNT):
+        """ returns the GainStats of a gain file, rows without a count have count """
+        stats = cls()
+        for row in np.loadtxt(resolve_gain_file(filename), ndmin=2):
+            points = int(row[3]) if row.size > 3 else count
+            stats._points[round(float(row[0]), 2)] = [points, float(row[1]),
+                                                      float(row[2]) ** 2 * points]
+        return stats
+
+    def add(self, raw, gain):
+        """ adds a gain measured at raw, returns the point's count """
+        point = self._points.setdefault(round(float(raw), 2), [0, 0.0, 0.0])
+        point[0] += 1
+        delta = gain - point[1]
+        point[1] += delta / point[0]
+        point[2] += delta * (gain - point[1])
+        return point[0]
+
+    def arrays(self, low=-np.inf, high=np.inf):
+        """ returns (raws, counts, means, stds) of the points from low to high by raw """
+        raws = np.array(sorted(raw for raw in self._points if low <= raw <= high), dtype=float)
+        points = np.array([self._points[raw] for raw in raws.tolist()], dtype=float)
+        points = points.reshape(-1, 3)
+        counts = points[:, 0].astype(int)
+        return raws, counts, points[:, 1], np.sqrt(points[:, 2] / np.maximum(counts, 1))
+
+    def save(self, filename):
+        """ atomically writes the points as a 'raw gain std count' gain file """
+        temp = filename + '.tmp'
+        with open(temp, 'w') as gain_file:
+            for row in zip(*self.arrays()):
+                gain_file.write("{0:.2f} {2:.2f} {3:.2f} {1:d}\n".format(*row))
+        getattr(os, 'replace', os.rename)(temp, filename)
+
+    def __len__(self):
+        return len(self._points)
+
+
+def standard_error(counts, stds):
+    """ standard errors of means from population stds, inf with less than two measurements """
+    counts = np.asarray(counts)
+    return np.where(counts > 1, stds / np.sqrt(np.maximum(counts - 1, 1)), np.inf)
+
+
+def interpolation_error(raws, gains):
+    """ estimated error (h**2 / 8 * |gain''|) of interpolating between each pair of points """
+    steps = np.diff(raws)
+    if raws.size < 3:
+        return np.full(steps.size, np.inf)
+    slopes = np.diff(gains) / steps
+    curvature = np.abs(2 * np.diff(slopes) / (steps[:-1] + steps[1:]))
+    # the end points take the curvature of their neighbour
+    curvature = np.concatenate([curvature[:1], curvature, curvature[-1:]])
+    return steps ** 2 / 8 * np.maximum(curvature[:-1], curvature[1:])
+
+
+def next_points(stats, low, high, target_error, min_step=.25, limit=10):
+    """
+    returns (raws, error): up to limit raw powers to measure next, worst first,
+    and the estimated worst error (dB) of the gain map from low to high
+    """
+    raws, counts, means, stds = stats.arrays(low, high)
+    if raws.size < 2:
+        return np.linspace(low, high, max(limit, 2)), np.inf
+    errors = interpolation_error(raws, means)
+    stderrs = standard_error(counts, stds)
+    candidates = [(errors[i], round((raws[i] + raws[i + 1]) / 2, 2)) for i in
+                  np.flatnonzero((errors > target_error) & (np.diff(raws) >= 2 * min_step))]
+    candidates += [(stderrs[i], raws[i]) for i in np.flatnonzero(stderrs > target_error)]
+    candidates.sort(reverse=True)
+    error = max(errors.max(), stderrs.max())
+    return np.array(sorted(set(raw for _, raw in candidates[:limit]))), error
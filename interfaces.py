@@ -13,7 +13,7 @@ and easily merge that with built in classes which talk directly to the devices
 """
 import time
 import socket
-import select
+import threading
 import warnings
 
 def check_interface(interface):
@@ -58,9 +58,19 @@ class BaseInterface(object):
 class SocketInterface(BaseInterface):
     """
     Interface to talk through a socket
+    reads return one frame: up to read_termination or a whole #<n><len> block
     """
+    read_termination = None
+
     def __init__(self, addr, timeout=10000, source_address=None):
         self._sock = socket.create_connection(addr, timeout/1E3, source_address)
+        # commands are small, don't let Nagle hold them back waiting for acks
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._buffer = bytearray(self.chunk_size)
+        self._start = 0 # unread data is self._buffer[self._start:self._end]
+        self._end = 0
+        self._scanned = 0 # unread bytes already searched for read_termination
+        self._block_tail = False # last frame was a block returned before its terminator
 
     def write_raw(self, message):
         try:
@@ -71,24 +81,94 @@ class SocketInterface(BaseInterface):
         return bytes_sent
 
     def read_raw(self, size=None):
-        size = self.chunk_size if size is None else size
-        ret = bytes()
+        """ read one frame (at most size bytes of it), return read bytes """
         try:
-            chunk = self._sock.recv(size)
-            ret += chunk
-
-            while len(chunk) == size:
-                sock, _, _ = select.select([self._sock], [], [], 0.5)
-                if sock:
-                    assert False
-                    assert sock == self._sock
-                    chunk = self._sock.recv(size)
-                    ret += chunk
+            length = self._frame_length()
+            while length is None and (size is None or self._end - self._start < size):
+                if not self._recv():
+                    # connection closed, return whatever is left
+                    length = self._end - self._start
+                    break
+                length = self._frame_length()
         except socket.timeout as err:
             raise InterfaceTimeoutError(err)
 
+        if length is None:
+            length = size
+        if size is not None:
+            length = min(length, size)
+        ret = bytes(self._buffer[self._start:self._start + length])
+        self._start += length
+        self._scanned = 0
         return ret
 
+    def _recv(self):
+        """ receives into the free end of the buffer, returns bytes received """
+        if self._start == self._end:
+            self._start = self._end = 0
+        if self._end == len(self._buffer):
+            unread = self._end - self._start
+            if unread > len(self._buffer) // 2:
+                self._buffer.extend(bytearray(len(self._buffer)))
+            # move unread data to the front instead of allocating
+            self._buffer[:unread] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, unread
+        received = self._sock.recv_into(memoryview(self._buffer)[self._end:])
+        self._end += received
+        return received
+
+    def _frame_length(self):
+        """ returns length of the first complete frame in the buffer or None """
+        if self._start == self._end:
+            return None
+        term = self.read_termination
+        if term and not isinstance(term, bytes):
+            term = term.encode('ascii')
+
+        if self._block_tail and term:
+            # the terminator of the last block arrived after it was returned
+            if self._end - self._start < len(term):
+                return None
+            if self._buffer[self._start:self._start + len(term)] == term:
+                self._start += len(term)
+            self._block_tail = False
+            if self._start == self._end:
+                return None
+
+        if self._buffer[self._start:self._start + 1] == b'#':
+            header_end = self._start + 2
+            if self._end < header_end:
+                return None
+            digits = self._buffer[self._start + 1:header_end]
+            digits = int(digits) if digits.isdigit() else 0
+            if digits > 0:
+                if self._end < header_end + digits:
+                    return None
+                length = 2 + digits + int(self._buffer[header_end:header_end + digits])
+                if self._end - self._start < length:
+                    return None
+                # don't wait for a terminator, the device may end the block with EOI only
+                tail = self._start + length
+                if term and self._end - tail >= len(term):
+                    if self._buffer[tail:tail + len(term)] == term:
+                        length += len(term)
+                elif term:
+                    self._block_tail = True
+                return length
+
+        if not term:
+            return self._end - self._start
+        index = self._buffer.find(term, self._start + max(self._scanned - len(term) + 1, 0),
+                                  self._end)
+        if index < 0:
+            self._scanned = self._end - self._start
+            return None
+        return index + len(term) - self._start
+
+    def close(self):
+        """ closes the socket """
+        self._sock.close()
+
     @property
     def timeout(self):
         """ returns socket timeout in ms"""
@@ -101,49 +181,91 @@ class SocketInterface(BaseInterface):
 
 
 class PrologixEnetController(SocketInterface):
-    """ used to control multiple devices on a Prologix Ethernet controller """
+    """
+    used to control multiple devices on a Prologix Ethernet controller
+    sessions from open() share its socket, ++addr is only sent on a switch
+    """
     _PORT = 1234
     _eos = {'\r\n':0, '\r':1, '\n':2, '':3} # gpib termination chars
-    def __init__(self, ip, timeout=10000, source_address=None):
-        super(PrologixEnetController, self).__init__((ip, self._PORT),
+    def __init__(self, ip, timeout=10000, source_address=None, port=None):
+        port = self._PORT if port is None else port
+        super(PrologixEnetController, self).__init__((ip, port),
                                                      timeout=timeout,
                                                      source_address=source_address)
-        self._interfaces = set()
+        self._interfaces = {}
         self._active = None
+        self._active_eos = None
+        self._lock = threading.RLock()
         """
         for more info see prologix.biz manual
         mode 1 - sets controller mode
-        auto 1 - automatically read
+        auto 0 - only read when asked with ++read
         lon 0 - disable listen only mode
         """
-        init_msg = "++mode 1\n" + "++auto 1\n" + "++lon 0\n"
-        self.write_raw(init_msg)
+        init_msg = "++mode 1\n" + "++auto 0\n" + "++lon 0\n"
+        self.write_raw(init_msg.encode('ascii'))
 
     def open(self, gpib_addr, **kwargs):
         """ returns a new PrologixEnetInterface """
         check_gpib(gpib_addr)
-        
-        # TODO: better error 
+
+        # TODO: better error
         if gpib_addr in self._interfaces:
             raise ValueError("GPIB interface already active")
         plx_interface = PrologixEnetInterface(self, gpib_addr)
         for key, value in kwargs.items():
             getattr(plx_interface, key)
             setattr(plx_interface, key, value)
-        self._interfaces.update(gpib_addr)
+        self._interfaces[gpib_addr] = plx_interface
         return plx_interface
 
     def close(self, plx_interface):
-        pass
+        """ ends the session of plx_interface so its address can be opened again """
+        with self._lock:
+            if self._interfaces.get(plx_interface.gpib_addr) is not plx_interface:
+                raise ValueError("GPIB interface not open on this controller")
+            del self._interfaces[plx_interface.gpib_addr]
+            if self._active == plx_interface.gpib_addr:
+                self._active = None
 
     def activate(self, plx_interface):
-        pass
+        """ addresses plx_interface's device if it isn't the active one """
+        with self._lock:
+            if self._interfaces.get(plx_interface.gpib_addr) is not plx_interface:
+                raise ValueError("GPIB interface not open on this controller")
+            cmds = ""
+            if self._active != plx_interface.gpib_addr:
+                cmds += "++addr " + gpib_addr_str(plx_interface.gpib_addr) + "\n"
+            eos = self._eos.get(plx_interface.write_termination, 3)
+            if self._active_eos != eos:
+                cmds += "++eos {0:d}\n".format(eos)
+            if cmds:
+                SocketInterface.write_raw(self, cmds.encode('ascii'))
+            self._active = plx_interface.gpib_addr
+            self._active_eos = eos
 
     def interface_write_raw(self, plx_interface, message):
-        pass
-
-    def interface_read_raw(self, plx_interface, size):
-        pass
+        """ writes message to plx_interface's device, returns bytes written """
+        with self._lock:
+            self.activate(plx_interface)
+            body = message.rstrip(b'\r\n')
+            SocketInterface.write_raw(self, prologix_escape(body) + b'\n')
+        return len(message)
+
+    def interface_read_raw(self, plx_interface, size=None):
+        """ reads the answer of plx_interface's device """
+        with self._lock:
+            self.activate(plx_interface)
+            term = plx_interface.read_termination
+            if term and len(term) == 1 and not plx_interface.read_eoi:
+                read_cmd = "++read {0:d}\n".format(ord(term))
+            else:
+                read_cmd = "++read eoi\n"
+            self.read_termination = term
+            if self.timeout != plx_interface.timeout:
+                self.timeout = plx_interface.timeout
+            SocketInterface.write_raw(self, read_cmd.encode('ascii'))
+            return SocketInterface.read_raw(self, size)
 
 
 class PrologixEnetInterface(BaseInterface):
@@ -151,6 +273,7 @@ class PrologixEnetInterface(BaseInterface):
     read_termination = None
     write_termination = "\r\n"
     timeout = 30000
+    read_eoi = False # read until EOI even if read_termination is set
 
     def __init__(self, controller, gpib_addr):
         self._controller = controller
@@ -160,51 +283,129 @@ class PrologixEnetInterface(BaseInterface):
     def gpib_addr(self):
         return self._gpib_addr
 
+    def write_raw(self, message):
+        return self._controller.interface_write_raw(self, message)
+
+    def read_raw(self, size=None):
+        return self._controller.interface_read_raw(self, size)
+
+    def close(self):
+        """ closes this session on the controller """
+        self._controller.close(self)
+
 MAV = 0x10
 ERR = 0x4
 class TempPrologixEnetInterface(SocketInterface):
-    """ works for only one device at a time """
-    def __init__(self, gpib_addr, addr, timeout=10000, source_address=None):
+    """
+    works for only one device at a time
+    completion is how read_raw waits for MAV: 'poll', 'backoff' or 'srq'
+    """
+    COMPLETIONS = ('poll', 'backoff', 'srq')
+    read_eoi = False # read until EOI instead of LF (for binary answers)
+    poll_interval = .05
+    min_interval = .001
+    poll_timeout = 50
+
+    def __init__(self, gpib_addr, addr, timeout=10000, source_address=None, completion='backoff'):
         check_gpib(gpib_addr)
+        if completion not in self.COMPLETIONS:
+            raise ValueError("completion must be one of " + ", ".join(self.COMPLETIONS))
         super(TempPrologixEnetInterface, self).__init__(addr, 1000, source_address)
-        self.write_raw("++mode 1\n++auto 0\n++addr " + str(gpib_addr) + '\n'+ '++eos 0\n*CLS;*WAI;*SRE 32\n')
-        # TODO: see about removing this test
+        self.completion = completion
+        self.latency = None
+        self._write_time = time.time()
+        self.reset_stats()
+        sre = 32 | MAV if completion == 'srq' else 32
+        self._command("++mode 1\n++auto 0\n++addr " + str(gpib_addr) + '\n'+ '++eos 0\n' +
+                      "*CLS;*WAI;*SRE {0:d}\n".format(sre))
+        # drop anything the device still had to say from an earlier session
         try:
             while True:
-                print("TRY")
-                print("READ:" + self._read_raw())
+                warnings.warn("discarded stale output " + repr(self._read_raw()))
         except InterfaceTimeoutError:
-            print("DONE")
             self.timeout = timeout
 
+    def reset_stats(self):
+        """ zeroes poll_count, wait_time and read_count """
+        self.poll_count = 0
+        self.wait_time = 0.0
+        self.read_count = 0
+
+    def write_raw(self, message):
+        self._write_time = time.time()
+        return super(TempPrologixEnetInterface, self).write_raw(message)
+
     def read_raw(self, size=None):
         timeout = self.timeout
-        self.timeout = 50
-        runs = int(timeout // 50 + 1)
-        for i in range(runs):
-            try:
-                stb = self.serial_poll()
-                if (stb & MAV) == MAV:
-                    self.timeout = timeout
-                    self.write_raw("++read {:d}\n".format(ord('\n')))
-                    return self._read_raw()
-                time.sleep(.05)
-            except InterfaceTimeoutError:
-                pass
-        self.timeout = timeout
-        raise InterfaceTimeoutError
+        deadline = time.time() + timeout / 1000.0
+        self.timeout = self.poll_timeout
+        try:
+            for delay in self._poll_delays():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise InterfaceTimeoutError("no message available from device")
+                if delay > 0:
+                    delay = min(delay, remaining)
+                    time.sleep(delay)
+                    self.wait_time += delay
+                if self._message_available():
+                    break
+        finally:
+            self.timeout = timeout
+
+        observed = time.time() - self._write_time
+        self.latency = observed if self.latency is None else .7 * self.latency + .3 * observed
+        self.read_count += 1
+        self._command("++read eoi\n" if self.read_eoi else "++read {:d}\n".format(ord('\n')))
+        return self._read_raw(size)
+
+    def _poll_delays(self):
+        """ yields the time to sleep before each poll """
+        if self.completion == 'poll':
+            yield 0.0
+            while True:
+                yield self.poll_interval
+
+        delay = 0.0
+        if self.latency is not None:
+            delay = .9 * self.latency - (time.time() - self._write_time)
+        yield max(delay, 0.0)
+        delay = self.min_interval
+        while True:
+            yield delay
+            delay = min(2 * delay, self.poll_interval)
+
+    def _message_available(self):
+        """ returns True if the device has a message available """
+        try:
+            if self.completion == 'srq' and not self.service_requested():
+                return False
+            return (self.serial_poll() & MAV) == MAV
+        except InterfaceTimeoutError:
+            return False
+
+    def _command(self, message):
+        """ writes adapter commands without counting them as device writes """
+        return SocketInterface.write_raw(self, message.encode('ascii'))
 
     def _read_raw(self, size=None):
         return super(TempPrologixEnetInterface, self).read_raw(size)
 
     def serial_poll(self):
-        self.write_raw("++spoll\n")
-        stb = int(self._read_raw().rstrip('\r\n'))
-        
+        self.poll_count += 1
+        self._command("++spoll\n")
+        stb = int(self._read_raw().rstrip(b'\r\n'))
+
         if (stb & ERR) == ERR:
             warnings.warn("Device has error bit set")
         return stb
 
+    def service_requested(self):
+        """ returns True if the SRQ line is asserted """
+        self.poll_count += 1
+        self._command("++srq\n")
+        return int(self._read_raw().rstrip(b'\r\n')) == 1
+
     # def __del__(self):
     #     self.write_raw("++rst\n")
 
@@ -228,3 +429,21 @@ def check_gpib(gpib_addr):
             raise ValueError("gpib address must be between 0 and 30 inclusive")
     else:
         raise TypeError("gpib address must be integer")
+
+
+def gpib_addr_str(gpib_addr):
+    """ returns gpib_addr formatted for ++addr (secondary address offset by 96) """
+    if isinstance(gpib_addr, tuple):
+        pad, sad = gpib_addr
+        return "{0:d} {1:d}".format(int(pad), int(sad) + 96)
+    return str(int(gpib_addr))
+
+
+def prologix_escape(data):
+    """ escapes CR, LF, ESC and '+' in data with ESC so the adapter passes them through """
+    ret = bytearray()
+    for char in bytearray(data):
+        if char in (10, 13, 27, 43):
+            ret.append(27)
+        ret.append(char)
+    return bytes(ret)
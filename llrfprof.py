@@ -8,40 +8,192 @@ from six.moves import input
 from interfaces import SocketInterface, TempPrologixEnetInterface
 from specanalyzer import RandSFSP
 from bncinst import BNC845
+from signalgenerator import SignalGenerator, SweepPlan
+from settle import STRATEGIES, FixedSettle, UpdateSettle
+from gainmap import GainMap
+from tracing import Tracer
+from sessions import SessionRegistry
+from datafile import (SweepWriter, TextWriter, Journal, ROW_FORMAT, EXTENSION, load_checkpoint,
+                      open_writer)
 
-from adcutils import which_channel, gen_filename, adc_vals
+from adcutils import (CHANNELS, which_channel, which_channels, gen_filename, adc_vals_many,
+                      unique, ADCMonitor)
 
 GEN_ADDR = ('131.243.171.52', 18)
+SPEC_ADDR = (18, ("131.243.171.57", 1234))
 GEN_MIN = -30
 GEN_MAX = 15
 FREQ = 185.7E6
 SPAN = .03E6
 POINTS = 91
-ROW_FORMAT = " ".join(["{" + str(i) + ":>10f}" for i in range(4)]) + '\n'
+SYNC_POINTS = 10
+# open instruments by address, reused by later sweeps in the same process
+SESSIONS = SessionRegistry()
+RESUME_ARGS = ('min', 'max', 'points', 'settle', 'tolerance', 'monitor', 'list_sweep', 'verify',
+               'text')
 
 
 def main(args):
     """ runs either profile or measure channel after asking for correct channel """
-    channel = which_channel()
+    tracer = Tracer() if args.trace else None
+    try:
+        run(args, tracer)
+    finally:
+        if tracer is not None:
+            # the instruments stay open in SESSIONS
+            tracer.detach()
+            print(tracer.report())
+            tracer.export_chrome_trace(args.trace)
 
-    if args.profile:
-        profile(args, channel)
+def run(args, tracer=None, ca=None):
+    """
+    runs what args select
+
+    tracer (a tracing.Tracer) is attached to the instruments and ca is the
+    channel access module the adcs are read with (pyepics by default). With
+    args.repeat the inputs of another sweep are asked for after each one, the
+    instruments stay open in SESSIONS in between.
+    """
+    if args.resume:
+        resume(args, tracer, ca)
         sys.exit(0)
 
-    measure_channel(args, channel)
+    while True:
+        if args.channels:
+            measure_channels(args, which_channels(args.channels), tracer=tracer, ca=ca)
+        elif args.profile:
+            profile(args, which_channel(), tracer)
+        else:
+            measure_channels(args, [which_channel()], tracer=tracer, ca=ca)
+        if not args.repeat or not next_inputs(args):
+            return
+
+def next_inputs(args):
+    """ asks for min and max of the next sweep, returns False if there is none """
+    while True:
+        answer = input("Next sweep min max (blank to quit): ").split()
+        if not answer:
+            return False
+        try:
+            args.min, args.max = [float(value) for value in answer]
+            return True
+        except ValueError:
+            print('\nPlease enter min and max')
+
+def resume(args, tracer=None, ca=None):
+    """ continues the sweep whose checkpoint (or data file) is args.resume """
+    checkpoint = load_checkpoint(args.resume)
+    for name, value in checkpoint['args'].items():
+        setattr(args, name, value)
+    channels = [channel for name in checkpoint['channels'] for channel in CHANNELS
+                if channel.name == name]
+    if checkpoint['points'] >= args.points:
+        print("Sweep already complete")
+        return
+    print("Resuming after point {0:d} of {1:d}".format(checkpoint['points'], args.points))
+    measure_channels(args, channels, checkpoint, tracer, ca)
+
+def measure_channels(args, channels, checkpoint=None, tracer=None, ca=None):
+    """
+    measures the output of channels for inputs from min to max in one sweep
+
+    The generator is driven with the first channel's gain file and every
+    channel's adc is sampled at each point. Each channel gets its own data
+    file (a sweep file, see datafile.py, or text with --text) with the real
+    power from its own gain file (nan outside of it).
 
-def measure_channel(args, channel):
-    """ measures channel output for inputs from min to max """
-    if inputs_ok(args.min, args.max) != 'Y':
+    The data files are synced every SYNC_POINTS points and a checkpoint next
+    to the first one records the completed points. If checkpoint (from
+    datafile.load_checkpoint) is given the sweep continues after them. tracer
+    and ca are as in run.
+    """
+    if not args.yes and inputs_ok(args.min, args.max) != 'Y':
         sys.exit(0)
-    gen = init_gen(args.min, args.max, channel.gain_file)
+    gen = init_gen(args.min, args.max, channels[0].gain_file, args.gen_addr, tracer)
     inputs = np.linspace(args.min, args.max, num=args.points, endpoint=True)
-    with open("data/" + gen_filename(channel.name), 'w+') as data_file:
-        gen.power_sweep(inputs, output_callback, (channel.adc, data_file), delay=.1)
+    done = checkpoint['points'] if checkpoint is not None else 0
+    plan = SweepPlan(gen, inputs[done:], delay=.1)
+    adcs = unique(channel.adc for channel in channels)
+    monitor = ADCMonitor(adcs, ca) if args.monitor or args.settle == 'update' else None
+    read_adcs = init_read_adcs(adcs, monitor, ca)
+    settle = init_settle(args, adcs, read_adcs, monitor)
+    sweep_info = {'min': args.min, 'max': args.max, 'points': args.points,
+                  'settle': args.settle, 'list_sweep': args.list_sweep, 'verify': args.verify}
+    outputs = []
+    journal = None
+    complete = False
+    try:
+        for i, channel in enumerate(channels):
+            gain_map = None
+            if channel.gain_file != channels[0].gain_file:
+                gain_map = GainMap.load(channel.gain_file)
+            if checkpoint is not None:
+                writer = open_writer(checkpoint['files'][i])
+                writer.truncate(done)
+            else:
+                writer = init_writer(args, channel, channels[0].gain_file, sweep_info)
+            outputs.append((channel, gain_map, writer))
+        journal = Journal([writer for _, _, writer in outputs], sync_points=SYNC_POINTS,
+                          state={'args': {name: getattr(args, name) for name in RESUME_ARGS},
+                                 'channels': [channel.name for channel in channels]})
+        sweep = gen.list_sweep if args.list_sweep else gen.power_sweep
+        report = sweep(plan, output_callback, (read_adcs, outputs, journal), settle=settle,
+                       verify=args.verify)
+        complete = True
+    finally:
+        if journal is not None:
+            journal.close(complete)
+        else:
+            for _, _, writer in outputs:
+                writer.close()
+        if monitor is not None:
+            monitor.close()
+    print("Sweep: " + str(report))
+    for index, msg in report.failures:
+        print("  point {0:d}: {1}".format(index, msg))
+    for code, msg in report.errors:
+        print("  error {0:d}: {1}".format(code, msg))
+    print("Settle time: {0:.2f} s total, {1:d} timeouts".format(sum(settle.times),
+                                                               settle.timeouts))
+
+def init_writer(args, channel, sweep_gain_file, sweep_info):
+    """ returns the data file writer for channel """
+    filename = "data/" + gen_filename(channel.name)
+    if args.text:
+        return TextWriter(filename)
+    return SweepWriter(filename + EXTENSION, channel=channel.name, adc=channel.adc,
+                       gain_file=channel.gain_file, sweep_gain_file=sweep_gain_file,
+                       frequency=FREQ, sweep=sweep_info)
+
+def init_read_adcs(adcs, monitor=None, ca=None):
+    """ returns a function reading {adc: (adc_min, adc_max)}, from monitor if given """
+    if monitor is not None:
+        return lambda: {adc: monitor.values(adc) for adc in adcs}
+    return lambda: adc_vals_many(adcs, ca)
+
+def init_settle(args, adcs, read_adcs, monitor=None):
+    """ returns the settle strategy selected by args, waiting for all of adcs """
+    if args.settle == 'fixed':
+        return FixedSettle(.1)
+    if args.settle == 'update':
+        return UpdateSettle(lambda after, timeout: [monitor.wait_update(adc, after, timeout)
+                                                    for adc in adcs])
+    def measure():
+        """ every adc value as one reading """
+        vals = read_adcs()
+        return tuple(val for adc in adcs for val in vals[adc])
+    return STRATEGIES[args.settle](measure, args.tolerance)
+
+def init_spec(addr=SPEC_ADDR, tracer=None):
+    """ returns initialized spectrum analyzer, the open one if it's still alive """
+    spec = SESSIONS.get(addr, lambda: open_spec(addr))
+    if tracer is not None:
+        tracer.attach(spec)
+    return spec
 
-def init_spec():
-    """ returns initialized spectrum analyzer """
-    interface = TempPrologixEnetInterface(18, ("131.243.171.57", 1234))
+def open_spec(addr=SPEC_ADDR):
+    """ connects to, resets and configures the spectrum analyzer """
+    interface = TempPrologixEnetInterface(*addr)
     spec = RandSFSP(interface)
     spec.timeout = 30000
     spec.query_delay = 0
@@ -51,41 +203,143 @@ def init_spec():
     spec.set_window(FREQ, SPAN)
     return spec
 
-def init_gen(min_output, max_output, gain_file=None):
-    """ returns initialized signal generator """
-    interface = SocketInterface(("131.243.171.52", 18))
-    gen = BNC845(interface, min_output=min_output, max_output=max_output, gain_file=gain_file)
+def init_gen(min_output, max_output, gain_file=None, addr=GEN_ADDR, tracer=None):
+    """ returns initialized signal generator, the open one if it's still alive """
+    gen = SESSIONS.get(addr, lambda: BNC845(SocketInterface(addr)))
+    gen.configure(min_output, max_output, gain_file)
     gen.signal_on = False
+    if tracer is not None:
+        tracer.attach(gen)
     return gen
 
 def output_callback(raw_power, real_power, state):
     """ callback to output raw data """
-    adc, data_file = state
-    adc_min, adc_max = adc_vals(adc)
-    print(ROW_FORMAT.format(raw_power, real_power, adc_min, adc_max))
-    data_file.write(ROW_FORMAT.format(raw_power, real_power, adc_min, adc_max))
+    read_adcs, outputs, journal = state
+    vals = read_adcs()
+    for channel, gain_map, writer in outputs:
+        adc_min, adc_max = vals[channel.adc]
+        channel_power = real_power if gain_map is None else channel_real(gain_map, raw_power)
+        row = ROW_FORMAT.format(raw_power, channel_power, adc_min, adc_max)
+        print(row if len(outputs) == 1 else channel.name + ': ' + row, end='')
+        writer.write(raw_power, channel_power, adc_min, adc_max)
+    journal.point_done()
 
+def channel_real(gain_map, raw_power):
+    """ real power of raw_power in gain_map, nan if it is outside the map """
+    try:
+        return gain_map.raw_to_real(raw_power)
+    except ValueError:
+        return float('nan')
 
-def profile(args, channel):
-    """ profile generator for specified channel """
-    gen = init_gen(args.min, args.max)
-    spec = init_spec()
+
+def profile(args, channel, tracer=None):
+    """
+    profile generator for specified channel, returns the number of points measured
+
+    By default the channel's gain file is refined adaptively (continuing from
+    it) until its estimated error is below args.target_error, with --grid
+    81 evenly spaced points are measured args.runs times instead (fewer if
+    args.max_stderr is reached). tracer is as in run.
+    """
+    gen = init_gen(args.min, args.max, addr=args.gen_addr, tracer=tracer)
+    spec = init_spec(args.spec_addr, tracer)
+    attn = fsp_attenuation(channel)
+    gain_file = args.gain_file or channel.gain_file
+    get_real_power = lambda: spec.get_peak() - attn
+    if args.grid:
+        output_powers = np.linspace(args.min, args.max, 81)
+        points = gen.profile(gain_file, output_powers, get_real_power, runs=args.runs,
+                             max_stderr=args.max_stderr)
+    else:
+        points = gen.refine_profile(gain_file, get_real_power, args.min, args.max,
+                                    target_error=args.target_error)
+    print("Auto reference level: {0:d} run, {1:d} skipped".format(spec.auto_ref_count,
+                                                                 spec.auto_ref_skipped))
+    return points
+
+def fsp_attenuation(channel):
+    """ dB between the amplifier and the spectrum analyzer when profiling channel """
     attn = -20 if int(channel.gain_file.lstrip("BNC_AMP")[:1]) != 0 else 0
     if channel.gain_file == 'BNC_AMP30_ATN-20':
         attn = 0
-    output_powers = np.linspace(args.min, args.max, 81)
-    gen.profile(channel.gain_file, output_powers, lambda: spec.get_peak() - attn, runs=3)
+    return attn
+
 def inputs_ok(low, high):
     """ ask for confirmation that inputs are alright """
     print("Input Low: " + str(low) + "\nInput High: " +
           str(high))
     return input("Are these inputs ok? [Y/n]: ")
 
-if __name__ == "__main__":
+def socket_addr(text):
+    """ returns (host, port) of 'host:port' """
+    host, _, port = text.rpartition(':')
+    try:
+        return host, int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected host:port, got " + repr(text))
+
+def prologix_addr(text):
+    """ returns (gpib address, (host, port)) of 'gpib@host:port' """
+    gpib_addr, _, addr = text.partition('@')
+    try:
+        return int(gpib_addr), socket_addr(addr)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected gpib@host:port, got " + repr(text))
+
+def build_parser():
+    """ returns the command line parser """
     parser = argparse.ArgumentParser(description="Profile llrf1")
-    parser.add_argument("min", type=float, help="Min signal power (dbm)")
-    parser.add_argument("max", type=float, help="Max signal power (dbm)")
+    parser.add_argument("min", type=float, nargs='?', help="Min signal power (dbm)")
+    parser.add_argument("max", type=float, nargs='?', help="Max signal power (dbm)")
     parser.add_argument("-p", "--points", type=int, default=101, help="Number of data points to take")
     parser.add_argument("--profile", help="Profile selected channel", action="store_true")
-    _ARGS = parser.parse_args()
+    parser.add_argument("--grid", action="store_true",
+                        help="Profile on a fixed grid of points instead of adaptively")
+    parser.add_argument("--runs", type=int, default=3, help="Runs of a --grid profile")
+    parser.add_argument("--max-stderr", type=float,
+                        help="Standard error (dB) at which a --grid profile stops measuring a point")
+    parser.add_argument("--target-error", type=float, default=.05,
+                        help="Estimated gain file error (dB) an adaptive profile stops at")
+    parser.add_argument("--gain-file",
+                        help="Gain file written by --profile, the channel's by default")
+    parser.add_argument("--channels",
+                        help="Comma separated channel numbers (or 'all') to measure together "
+                        "in one sweep, e.g. 0,1,2")
+    parser.add_argument("--resume", metavar="FILE",
+                        help="Continue an interrupted sweep from its data or checkpoint file")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Time every instrument command, print a summary and write a "
+                        "Chrome trace (chrome://tracing) to FILE")
+    parser.add_argument("--repeat", action="store_true",
+                        help="Ask for another sweep after each one, keeping the instruments open")
+    parser.add_argument("--gen-addr", type=socket_addr, default=GEN_ADDR, metavar="HOST:PORT",
+                        help="Address of the signal generator")
+    parser.add_argument("--spec-addr", type=prologix_addr, default=SPEC_ADDR,
+                        metavar="GPIB@HOST:PORT",
+                        help="GPIB address and Prologix adapter of the spectrum analyzer")
+    parser.add_argument("-y", "--yes", action="store_true", help="Don't ask to confirm the inputs")
+    parser.add_argument("--text", action="store_true",
+                        help="Write whitespace text data files instead of sweep files")
+    parser.add_argument("--list-sweep", help="Step power with the generator's list mode",
+                        action="store_true")
+    parser.add_argument("--settle", choices=sorted(STRATEGIES) + ['update'], default='fixed',
+                        help="How to wait for the adc reading to settle after each step "
+                        "('update' waits for the first new monitored reading)")
+    parser.add_argument("--monitor", action="store_true",
+                        help="Read the adc from channel access monitors instead of caget")
+    parser.add_argument("--tolerance", type=float, default=8,
+                        help="adc counts consecutive readings may differ by when settled")
+    parser.add_argument("--verify", choices=SignalGenerator.VERIFY_POLICIES, default='always',
+                        help="How generator writes are verified during the sweep")
+    return parser
+
+if __name__ == "__main__":
+    PARSER = build_parser()
+    _ARGS = PARSER.parse_args()
+    if not _ARGS.resume and (_ARGS.min is None or _ARGS.max is None):
+        PARSER.error("min and max are required unless resuming")
+    if _ARGS.channels and _ARGS.profile:
+        PARSER.error("--profile measures one channel, it can't be used with --channels")
+    if _ARGS.resume and _ARGS.repeat:
+        PARSER.error("--repeat can't be used with --resume")
     main(_ARGS)
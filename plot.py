@@ -1,25 +1,55 @@
 import os
+import json
+import argparse
+import multiprocessing
 import numpy as np
 import pandas as pd
 from adcutils import CHANNELS
+from catalog import Catalog
+from datafile import EXTENSION, is_sweep_file, read_sweep, save_json
 from matplotlib import pyplot as plt
 if __name__ == '__main__':
     import matplotlib
     matplotlib.use('Agg')
 
 SATURATED = 32764
+MANIFEST = 'manifest.json'
+# bump when the plots change so build_plots renders everything again
+PLOT_VERSION = 1
 
-def most_current(prefix, directory='./data'):
-    files = [filename for filename in os.listdir(directory)
-             if filename[0:len(prefix)] == prefix]
-    if files:
-        return files.pop()
+def open_catalog(directory='./data'):
+    """ returns the catalog of directory, brought up to date """
+    catalog = Catalog(directory)
+    catalog.update()
+    return catalog
+
+def most_current(prefix, directory='./data', catalog=None):
+    """
+    returns the newest data file starting with prefix, None if there is none
+
+    catalog is a catalog.Catalog of directory, updated by the caller (a fresh
+    one is opened if it isn't given)
+    """
+    own_catalog = catalog is None
+    if own_catalog:
+        catalog = open_catalog(directory)
+    try:
+        entry = catalog.latest(prefix=prefix, complete=False)
+    finally:
+        if own_catalog:
+            catalog.close()
+    if entry is not None:
+        return entry.filename
 
 
 def read_data(filename, channel):
     assert filename
     names = ['raw_input', 'real_input', 'adc_min', 'adc_max']
-    data = pd.read_csv(filename, delim_whitespace=True, header=None, names=names, index_col=1)
+    if is_sweep_file(filename):
+        header, rows = read_sweep(filename)
+        data = pd.DataFrame(np.asarray(rows), columns=header['columns']).set_index(names[1])
+    else:
+        data = pd.read_csv(filename, sep=r'\s+', header=None, names=names, index_col=1)
     data.name = channel.name.replace(' ', '_')
     data['measured_power'] = 20 * np.log10((data.adc_max - data.adc_min) / 65536.)
     return data
@@ -54,26 +84,43 @@ def saturation_point(data):
         return None
     return min(sat_adc_min, sat_adc_max)
 
-def get_data(channel):
+def data_files(channel, catalog):
+    """ returns the names of the data files of channel in catalog, oldest first """
+    return [entry.filename for entry in catalog.find(channel=channel)]
+
+def useful_data(data):
+    """
+    returns data up to its saturation point if it saturates and covers a range
+    of more than 15 dBm of input, otherwise None
+    """
+    sat_pt = saturation_point(data)
+    if sat_pt is None or data.index.max() - data.index.min() <= 15:
+        return None
+    return data[:sat_pt]
+
+def get_data(channel, directory='./data', catalog=None):
     """
     returns all data for a given channel that contains the saturation point and
     a range of at least 15 dBm of input
     """
-    directory = './data'
-    prefix = channel.name.replace(' ', '_')
-    filenames = [filename for filename in os.listdir(directory) if filename.startswith(prefix)]
-    raw_data = {filename: read_data(directory + '/' + filename, channel) for filename in filenames}
-    for filename, data in raw_data.iteritems():
+    own_catalog = catalog is None
+    if own_catalog:
+        catalog = open_catalog(directory)
+    try:
+        filenames = data_files(channel, catalog)
+    finally:
+        if own_catalog:
+            catalog.close()
+    raw_data = {filename: read_data(os.path.join(catalog.directory, filename), channel)
+                for filename in filenames}
+    for filename, data in raw_data.items():
         if saturation_point(data) is not None:
             dbm_range = data.index.max() - data.index.min()
             if dbm_range < 3:
                 print(filename + ' Saturation = ' + str(saturation_point(data)))
 
-    useful_data = {filename: data[:saturation_point(data)] for (filename, data) in raw_data.iteritems()
-                   if data.index.max() - data.index.min() > 15 and
-                   saturation_point(data) is not None}
-
-    return useful_data
+    useful = {filename: useful_data(data) for (filename, data) in raw_data.items()}
+    return {filename: data for (filename, data) in useful.items() if data is not None}
 
 def plot_measured_and_gain(channel, powers):
     """ plots the measured channel response and gain on two separate axes """
@@ -94,15 +141,84 @@ def plot_measured_and_gain(channel, powers):
     ax.set_title('Measured Gain vs Input')
     plt.suptitle('llrf1 ' + channel.name)
 
-def main():
+def plot_name(filename):
+    """ returns the name of the plot of a data file """
+    if filename.endswith(EXTENSION):
+        filename = filename[:-len(EXTENSION)]
+    return filename + ".png"
+
+def render_plot(job):
+    """ plots the data file of job = (channel, path, out), returns out or None if not useful """
+    channel, path, out = job
+    data = useful_data(read_data(path, channel))
+    if data is None:
+        return None
+    plot_measured_and_gain(channel, data.measured_power)
+    plt.savefig(out)
+    plt.close()
+    return out
+
+def build_plots(catalog, out_dir='plots', jobs=None, force=False):
+    """
+    renders the plots of the data files in catalog which changed since the
+    last build
+
+    The manifest in out_dir records each data file's modification time and
+    size with its plot (or None if the file isn't useful), so only new or
+    changed files are read again. Plots are rendered in a pool of jobs
+    processes (one per cpu by default). Returns the number of files rendered.
+    """
+    directory = catalog.directory
+    manifest_file = os.path.join(out_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as json_file:
+            manifest = json.load(json_file)
+    if force or manifest.get('version') != PLOT_VERSION:
+        manifest = {'version': PLOT_VERSION, 'files': {}}
+
+    entries = {}
+    stale = []
     for channel in CHANNELS:
-        chan_data = get_data(channel)
-        for filename, data in chan_data.iteritems():
-            plot_measured_and_gain(channel, data.measured_power)
-            plt.savefig("plots/" + filename + ".png")
-            plt.clf()
+        for filename in data_files(channel, catalog):
+            path = os.path.join(directory, filename)
+            stat = os.stat(path)
+            stamp = [stat.st_mtime, stat.st_size]
+            entry = manifest['files'].get(filename)
+            if (entry is not None and entry['stamp'] == stamp and
+                    (entry['plot'] is None or os.path.exists(entry['plot']))):
+                entries[filename] = entry
+            else:
+                stale.append((filename, stamp, (channel, path,
+                                                os.path.join(out_dir, plot_name(filename)))))
+
+    render_jobs = [job for _, _, job in stale]
+    if len(render_jobs) > 1 and jobs != 1:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            plots = pool.map(render_plot, render_jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        plots = [render_plot(job) for job in render_jobs]
+    for (filename, stamp, _), out in zip(stale, plots):
+        entries[filename] = {'stamp': stamp, 'plot': out}
+
+    manifest['files'] = entries
+    save_json(manifest_file, manifest)
+    return len(stale)
+
+def main(jobs=None, force=False):
+    with open_catalog() as catalog:
+        rendered = build_plots(catalog, jobs=jobs, force=force)
+    print("{0:d} data files rendered".format(rendered))
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Plot llrf1 channel data")
+    parser.add_argument("-j", "--jobs", type=int, help="Processes rendering plots")
+    parser.add_argument("--force", action="store_true", help="Render every plot again")
+    _ARGS = parser.parse_args()
+    main(_ARGS.jobs, _ARGS.force)
     
\ No newline at end of file
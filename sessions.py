@@ -0,0 +1,116 @@
+"""
+registry of open, configured instrument sessions
+
+Opening an instrument costs a connection, a reset and configuration, and for
+the Prologix adapter draining whatever the instrument still had to say. A
+SessionRegistry keeps the devices it opened keyed by address, so later
+sweeps in the same process (interactive use, several channels, benchmarks)
+get the already configured device back after a one round trip health check.
+A device failing the check is closed and opened again.
+
+    registry = SessionRegistry()
+    spec = registry.get(SPEC_ADDR, open_spec)  # opens and configures
+    spec = registry.get(SPEC_ADDR, open_spec)  # same device, *OPC? checked
+    registry.close_all()
+"""
+import socket
+import threading
+from time import time
+
+from interfaces import InterfaceTimeoutError
+
+
+def check_session(device, timeout=2000):
+    """ returns True if device answers *OPC? within timeout ms """
+    old_timeout = device.timeout
+    try:
+        device.timeout = timeout
+        return int(device.query("*OPC?")) == 1
+    except (InterfaceTimeoutError, socket.error, ValueError):
+        return False
+    finally:
+        try:
+            device.timeout = old_timeout
+        except socket.error:
+            pass
+
+
+def close_session(device):
+    """ closes the interface of device, ignoring errors of a dead connection """
+    close = getattr(getattr(device, '_interface', None), 'close', None)
+    if close is not None:
+        try:
+            close()
+        except (socket.error, ValueError):
+            pass
+
+
+class SessionRegistry(object):
+    """
+    open instrument sessions by key (usually the address)
+
+    Parameters
+    ----------
+    check : function(device), optional
+        health check run when a session is reused, returns False if the
+        device must be opened again
+    check_interval : float, optional
+        seconds since its last check (or opening) during which a session is
+        reused without checking it again
+
+    Attributes
+    ----------
+    opened, reused, reopened : int
+        sessions opened, reused after a passed check and reopened after a
+        failed one
+    """
+    def __init__(self, check=check_session, check_interval=0.0):
+        self.check = check
+        self.check_interval = check_interval
+        self.opened = 0
+        self.reused = 0
+        self.reopened = 0
+        self._sessions = {} # key: [device, time of the last check]
+        self._lock = threading.RLock()
+
+    def get(self, key, factory):
+        """
+        returns the live session of key, calling factory() to open and
+        configure a new device if there is none or it fails its health check
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                device, checked = session
+                if (self.check is None or time() - checked < self.check_interval or
+                        self.check(device)):
+                    session[1] = time()
+                    self.reused += 1
+                    return device
+                del self._sessions[key]
+                close_session(device)
+                self.reopened += 1
+            device = factory()
+            self._sessions[key] = [device, time()]
+            self.opened += 1
+            return device
+
+    def close(self, key):
+        """ closes and forgets the session of key, if there is one """
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session is not None:
+            close_session(session[0])
+
+    def close_all(self):
+        """ closes every session """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for device, _ in sessions.values():
+            close_session(device)
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
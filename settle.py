@@ -0,0 +1,120 @@
+"""
+settle strategies decide how long a sweep waits after a power step
+
+    settle = ThresholdSettle(lambda: adc_vals('adc4'), tolerance=8)
+    gen.power_sweep(plan, callback, state, settle=settle)
+    print(settle.times)
+"""
+from time import sleep, time
+
+
+class Settle(object):
+    """ base settle strategy, records the seconds waited at each point in times """
+    max_wait = 0.0
+    rf_max_wait = 1.0
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ clears recorded times """
+        self.times = []
+        self.rf_time = None
+        self.timeouts = 0
+
+    def rf_on(self):
+        """ waits after the signal is turned on, returns seconds waited """
+        start = time()
+        self.wait(self.rf_max_wait)
+        self.rf_time = time() - start
+        return self.rf_time
+
+    def point(self):
+        """ waits after a power step, returns seconds waited """
+        start = time()
+        self.wait(self.max_wait)
+        self.times.append(time() - start)
+        return self.times[-1]
+
+    def wait(self, max_wait):
+        """ waits at most max_wait seconds for the signal to settle """
+        raise NotImplementedError
+
+
+class FixedSettle(Settle):
+    """ waits delay seconds after every step and rf_delay after turning on """
+    def __init__(self, delay=0.0, rf_delay=1.0):
+        self.max_wait = delay
+        self.rf_max_wait = rf_delay
+        super(FixedSettle, self).__init__()
+
+    def wait(self, max_wait):
+        if max_wait > 0:
+            sleep(max_wait)
+
+
+class ThresholdSettle(Settle):
+    """ polls measure() until consecutive readings agree within tolerance """
+    growth = 1.0
+
+    def __init__(self, measure, tolerance, interval=.01, max_wait=1.0, consecutive=2,
+                 rf_max_wait=1.0):
+        self.measure = measure
+        self.tolerance = tolerance
+        self.interval = interval
+        self.max_wait = max_wait
+        self.consecutive = consecutive
+        self.rf_max_wait = rf_max_wait
+        self.value = None
+        super(ThresholdSettle, self).__init__()
+
+    def wait(self, max_wait):
+        deadline = time() + max_wait
+        interval = self.interval
+        last = self.measure()
+        agreeing = 1
+        while agreeing < self.consecutive:
+            remaining = deadline - time()
+            if remaining <= 0:
+                self.timeouts += 1
+                break
+            sleep(min(interval, remaining))
+            interval *= self.growth
+            value = self.measure()
+            agreeing = agreeing + 1 if difference(value, last) <= self.tolerance else 1
+            last = value
+        self.value = last
+
+
+class ExponentialSettle(ThresholdSettle):
+    """ ThresholdSettle with poll intervals doubling from interval """
+    growth = 2.0
+
+    def __init__(self, measure, tolerance, interval=.002, max_wait=1.0, consecutive=2,
+                 rf_max_wait=1.0):
+        super(ExponentialSettle, self).__init__(measure, tolerance, interval, max_wait,
+                                                consecutive, rf_max_wait)
+
+
+class UpdateSettle(Settle):
+    """ waits for the first new reading after each step, see ADCMonitor.wait_update """
+    def __init__(self, wait_update, max_wait=1.0, rf_max_wait=1.0):
+        self.wait_update = wait_update
+        self.max_wait = max_wait
+        self.rf_max_wait = rf_max_wait
+        self.value = None
+        super(UpdateSettle, self).__init__()
+
+    def wait(self, max_wait):
+        self.value = self.wait_update(time(), max_wait)
+
+
+STRATEGIES = {'fixed': FixedSettle, 'threshold': ThresholdSettle,
+              'exponential': ExponentialSettle}
+
+
+def difference(first, second):
+    """ largest absolute difference between two readings (numbers or tuples) """
+    if isinstance(first, (tuple, list)):
+        return max(abs(a - b) for a, b in zip(first, second))
+    return abs(first - second)
@@ -1,11 +1,13 @@
 """ contains signal generator classes """
 
 from __future__ import print_function
-from time import sleep
+import os
+from contextlib import contextmanager
 import numpy as np
-from scipy.interpolate import interp1d
 
 from devices import BaseDevice
+from gainmap import GainMap, GainStats, next_points, resolve_gain_file, standard_error
+from settle import FixedSettle
 
 DEFAULT_ADDRESS = ('131.243.201.231', 18)
 
@@ -21,6 +23,15 @@ class SignalGenerator(BaseDevice):
 
     WARNING: these maps are approximate (especially with unstable signals) USE AT YOUR OWN RISK
 
+    Writes are verified according to verify:
+        'always'   - read back every set value
+        'sampled'  - read back every verify_every-th value of each setting
+        'deferred' - don't read back, check the instrument's error queue once
+                     at the end of each sweep
+        'none'     - never verify
+    Failures found during a sweep are collected in its SweepReport instead of
+    being raised.
+
     TODO: make signal generator generic. Currently only works with BNC845 class.
 
     Parameters
@@ -35,22 +46,34 @@ class SignalGenerator(BaseDevice):
         maximum real power output that the signal generator is allowed to output.
 
     gain_file : str, optional
-        name of the gain file to use
+        name of the gain file to use (looked up in gain_files/ if not found)
 
     Returns
     -------
     SignalGenerator object
     """
+    VERIFY_POLICIES = ('always', 'sampled', 'deferred', 'none')
+    verify = 'always'
+    verify_every = 10
+
+    _report = None # SweepReport of the running sweep
+    _sets = None # setting: values set, for 'sampled'
+
     def __init__(self, interface, min_output=None, max_output=None, gain_file=None):
         # initialize signal generator
         super(SignalGenerator, self).__init__(interface)
+        self.configure(min_output, max_output, gain_file)
+
+    def configure(self, min_output=None, max_output=None, gain_file=None):
+        """
+        sets the output limits and gain file, limits default to the range of
+        the gain file (or no limit without one)
+        """
         self._gain_file = gain_file
         if self._gain_file is not None:
-            raws, gains = np.loadtxt(self._gain_file, unpack=True, usecols=[0, 1])
-            self._raw_to_real = interp1d(raws, raws + gains)
-            self._real_to_raw = interp1d(raws + gains, raws)
-            self.min_output = min_output if min_output is not None else self.raw_to_real(raws[0])
-            self.max_output = max_output if max_output is not None else self.raw_to_real(raws[-1])
+            self._gain_map = GainMap.load(self._gain_file)
+            self.min_output = min_output if min_output is not None else self._gain_map.min_real
+            self.max_output = max_output if max_output is not None else self._gain_map.max_real
         else:
             self.min_output = min_output if min_output is not None else -1E99
             self.max_output = max_output if max_output is not None else 1E99
@@ -77,71 +100,189 @@ class SignalGenerator(BaseDevice):
         new_power = self.real_to_raw(value)
         self.raw_power = new_power
 
-    def power_sweep(self, output_powers, callback, state=None, delay=0):
+    def power_sweep(self, output_powers, callback, state=None, delay=0, settle=None,
+                    verify=None):
         """
         sets the power to each power in out_powers in order calling callback with each set power
 
         Parameters
         ----------
-        out_powers : iterable
-            the output powers to use
-        callback : function(power, state)
-            called on each set power with power and state as arguments
+        out_powers : iterable or SweepPlan
+            the output powers to use. Powers are validated and converted to raw
+            powers (as a SweepPlan) before the signal is turned on
+        callback : function(raw_power, power, state)
+            called on each set power with raw power, power and state as arguments
         state :
             passed to callback on each set power
+        delay : float, optional
+            seconds to wait after each power is set (ignored for a SweepPlan,
+            which has its own delay)
+        settle : settle.Settle, optional
+            strategy deciding how long to wait after turning the signal on and
+            after each step, it records the time waited. Defaults to the plan's
+            fixed delays
+        verify : str, optional
+            verification policy for this sweep, defaults to self.verify
+
+        Returns
+        -------
+        SweepReport
         """
-        self.signal_on = False
-        self.power = output_powers[0]
+        plan = output_powers
+        if not isinstance(plan, SweepPlan):
+            plan = SweepPlan(self, output_powers, delay)
+        if settle is None:
+            settle = FixedSettle(plan.delay, plan.rf_settle)
+        settle.reset()
+
+        with self.verifying(verify):
+            with self.batch():
+                self.signal_on = False
+                self.start_sweep()
+                self.raw_power = plan.raws[0]
+
+            self._report = report = SweepReport(plan, settle)
+            try:
+                self.signal_on = True
+                settle.rf_on()
+
+                for raw, power in plan:
+                    self.raw_power = raw
+                    settle.point()
+                    callback(raw, power, state)
+                    report.points += 1
+            except:
+                self.signal_on = False
+                raise
+            finally:
+                self._report = None
 
-        try:
-            self.signal_on = True
-            sleep(1)
-
-            for power in output_powers:
-                raw = self.real_to_raw(power)
-                self.power = power
-                sleep(delay)
-                callback(raw, power, state)
-        except:
             self.signal_on = False
-            raise
-
-        self.signal_on = False
+            self.verify_sweep(report)
+        return report
+
+    @contextmanager
+    def verifying(self, verify=None):
+        """ temporarily sets the verification policy (None keeps the current one) """
+        verify = self.verify if verify is None else verify
+        if verify not in self.VERIFY_POLICIES:
+            raise ValueError("verify must be one of " + ", ".join(self.VERIFY_POLICIES))
+        old, self.verify = self.verify, verify
+        try:
+            yield
+        finally:
+            self.verify = old
+
+    def should_verify(self, setting=None):
+        """ returns True if the next set value of setting should be read back, per self.verify """
+        if self._sets is None:
+            self._sets = {}
+        self._sets[setting] = self._sets.get(setting, 0) + 1
+        if self.verify == 'always':
+            return True
+        if self.verify == 'sampled':
+            return self._sets[setting] % self.verify_every == 0
+        return False
+
+    def value_set_failed(self, err):
+        """ records err in the running sweep's report, or raises it outside a sweep """
+        self.invalidate()
+        if self._report is None:
+            raise err
+        self._report.failures.append((self._report.points, str(err)))
+
+    def start_sweep(self):
+        """ called before a sweep sets its first power """
+        pass
+
+    def verify_sweep(self, report):
+        """ called after a sweep to add deferred verification results to report """
+        pass
 
     def raw_to_real(self, raw_power):
-        """ returns real output from raw output """
+        """ returns real output(s) from raw output(s), accepts arrays """
         if self._gain_file is not None:
-            return float(self._raw_to_real(raw_power))
+            return self._gain_map.raw_to_real(raw_power)
         return raw_power
 
     def real_to_raw(self, real_power):
-        """ returns raw power from real power """
+        """ returns raw power(s) from real power(s), accepts arrays """
         if self._gain_file is not None:
-            return float(self._real_to_raw(real_power))
+            return self._gain_map.real_to_raw(real_power)
         return real_power
 
-    def profile(self, filename, output_powers, get_real_power, runs=3):
-        """ get description from old file """
+    def profile(self, filename, output_powers, get_real_power, runs=3, max_stderr=None):
+        """
+        measures the gain at raw powers output_powers up to runs times
+
+        Gains are accumulated per point (gainmap.GainStats) instead of kept,
+        and gain file filename (in gain_files/ if it's only there) is
+        rewritten after every run. If max_stderr is given points whose
+        standard error is below it aren't measured again, and profiling stops
+        once every point's is.
+
+        Returns the number of points measured
+        """
         assert self._gain_file is None
-        gains = np.empty((runs, len(output_powers)), dtype=np.float)
+        path = resolve_gain_file(filename)
+        stats = GainStats()
+        todo = np.asarray(output_powers, dtype=float)
+        measured = 0
         for i in range(runs):
+            if todo.size == 0:
+                break
             print("\nRun {0:d}:".format(i + 1))
-            state = (get_real_power, gains[i], iter(range(gains[i].size)))
-            self.power_sweep(output_powers, self.profile_callback, state)
+            plan = SweepPlan(self, todo)
+            self.power_sweep(plan, self.profile_callback, (get_real_power, stats))
+            measured += len(plan)
+            stats.save(path)
+            if max_stderr is not None:
+                raws, counts, _, stds = stats.arrays()
+                done = raws[standard_error(counts, stds) < max_stderr]
+                todo = todo[~np.isin(np.round(todo, 2), done)]
+        return measured
+
+    def refine_profile(self, filename, get_real_power, min_raw, max_raw, target_error=.05,
+                       coarse_step=2.0, runs=2, batch=10, min_step=.25, max_points=1000):
+        """
+        profiles the gain adaptively until its map is within target_error dB
 
-        means = gains.mean(axis=0)
-        stds = gains.std(axis=0)
-        with open(filename, 'w+') as gainfile:
-            for vals in zip(output_powers, means, stds):
-                gainfile.write("{0:.2f} {1:.2f} {2:.2f}\n".format(*vals))
+        Starts from the points already in gain file filename (in gain_files/
+        if it's only there) or a grid of raw powers coarse_step dB apart from
+        min_raw to max_raw, then repeatedly measures (runs times each, in one
+        sweep) the batch of points gainmap.next_points picks: middles of the
+        intervals whose interpolation error is too high and points whose run
+        to run standard error is. The gain file is rewritten after every batch.
+
+        Returns the number of points measured
+        """
+        assert self._gain_file is None
+        path = resolve_gain_file(filename)
+        stats = GainStats.load(path) if os.path.exists(path) else GainStats()
+        raws = stats.arrays(min_raw, max_raw)[0]
+        coarse = int(np.ceil((max_raw - min_raw) / coarse_step)) + 1
+        todo = [raw for raw in np.linspace(min_raw, max_raw, coarse)
+                if raws.size == 0 or np.abs(raws - raw).min() >= min_step]
+        if not todo:
+            # the file already covers the grid, refine it
+            todo = next_points(stats, min_raw, max_raw, target_error, min_step, batch)[0]
+        measured = 0
+        while len(todo) and measured < max_points:
+            plan = SweepPlan(self, np.tile(np.round(todo, 2), runs))
+            self.power_sweep(plan, self.profile_callback, (get_real_power, stats))
+            measured += len(plan)
+            stats.save(path)
+            todo, error = next_points(stats, min_raw, max_raw, target_error, min_step, batch)
+            print("\n{0:d} points measured, {1:d} in the map, estimated error {2:.3f} dB".format(
+                measured, len(stats), error))
+        return measured
 
     @staticmethod
     def profile_callback(raw_power, real_power, state):
-        """ get description from old file """
-        real_power = None
-        get_real_power, gains, counter = state
+        """ adds the gain at raw_power to the GainStats in state """
+        get_real_power, stats = state
         gain = get_real_power() - raw_power
-        gains[next(counter)] = gain
+        stats.add(raw_power, gain)
         print("Raw: {0:.2f}, Gain {1:.2f}".format(raw_power, gain))
 
     @property
@@ -173,3 +314,93 @@ class SignalGenerator(BaseDevice):
     def signal_on(self, value):
         """ set signal on or off """
         raise NotImplementedError
+
+
+class SweepPlan(object):
+    """
+    Validated power schedule for SignalGenerator.power_sweep
+
+    All range checks and real to raw conversions are done once, up front, so
+    bad inputs fail before the signal is turned on and the sweep loop only
+    sets raw powers.
+
+    Parameters
+    ----------
+    generator : SignalGenerator
+        generator whose output limits and gain file are used
+
+    output_powers : iterable
+        real output powers in sweep order
+
+    delay : float, optional
+        seconds to wait after each power is set
+
+    rf_settle : float, optional
+        seconds to wait after the signal is turned on
+
+    Raises
+    ------
+    ValueError
+        if output_powers is empty or a power is outside the generator's limits
+        or gain file
+    """
+    def __init__(self, generator, output_powers, delay=0, rf_settle=1):
+        reals = np.array(output_powers, dtype=float)
+        if reals.ndim != 1 or reals.size == 0:
+            raise ValueError("output_powers must be a non-empty sequence")
+        bad = (reals < generator.min_output) | (reals > generator.max_output)
+        if np.any(bad):
+            raise ValueError("output powers {0} outside [{1}, {2}]".format(
+                reals[bad], generator.min_output, generator.max_output))
+        raws = np.array(generator.real_to_raw(reals), dtype=float)
+        reals.setflags(write=False)
+        raws.setflags(write=False)
+        self.reals = reals
+        self.raws = raws
+        self.delay = delay
+        self.rf_settle = rf_settle
+
+    def __len__(self):
+        return self.reals.size
+
+    def __iter__(self):
+        """ yields (raw power, real power) pairs """
+        return zip(self.raws.tolist(), self.reals.tolist())
+
+    def estimated_duration(self, point_time=0.0):
+        """ seconds the sweep will take given point_time seconds of I/O per point """
+        return self.rf_settle + len(self) * (self.delay + point_time)
+
+
+class SweepReport(object):
+    """
+    Summary of a finished power sweep
+
+    Attributes
+    ----------
+    plan : SweepPlan
+        the sweep's schedule
+    settle : settle.Settle
+        settle strategy used, holds the time waited at each point
+    points : int
+        number of points completed
+    failures : list
+        (point index, message) for every value which could not be verified
+    errors : list
+        (code, message) read from the instrument's error queue at the end
+    """
+    def __init__(self, plan, settle):
+        self.plan = plan
+        self.settle = settle
+        self.points = 0
+        self.failures = []
+        self.errors = []
+
+    @property
+    def ok(self):
+        """ True if every point completed without failures or errors """
+        return self.points == len(self.plan) and not self.failures and not self.errors
+
+    def __str__(self):
+        return "{0:d}/{1:d} points, {2:d} failures, {3:d} errors".format(
+            self.points, len(self.plan), len(self.failures), len(self.errors))
@@ -0,0 +1,762 @@
+"""
+local fake instruments used to develop and benchmark without the real hardware
+
+Each simulator is a small threaded TCP server which understands the subset of
+SCPI the device classes use. The servers count every message and round trip so
+the cost of a sequence of device calls can be measured.
+
+with SimulatorServer(FakeBNC845(), latency=.005) as server:
+    gen = BNC845(SocketInterface(server.address))
+    gen.set_power(-10)
+    print(server.round_trips)
+"""
+from __future__ import print_function
+import re
+import random
+import threading
+import time
+from six.moves import socketserver
+
+UNITS = {'HZ': 1.0, 'KHZ': 1E3, 'MHZ': 1E6, 'GHZ': 1E9, 'DBM': 1.0, 'DB': 1.0,
+         'S': 1.0, 'MS': 1E-3, 'US': 1E-6}
+_NUMBER = re.compile(r'^([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)\s*([A-Za-z]*)$')
+
+
+def parse_value(arg):
+    """ parses a SCPI argument into a float (applying units) or returns it stripped """
+    arg = arg.strip()
+    if arg.upper() in ('ON', 'OFF'):
+        return 1.0 if arg.upper() == 'ON' else 0.0
+    match = _NUMBER.match(arg)
+    if match and (not match.group(2) or match.group(2).upper() in UNITS):
+        return float(match.group(1)) * UNITS.get(match.group(2).upper(), 1.0)
+    return arg
+
+
+def join_answers(answers):
+    """ returns the LF terminated reply bytes for a list of answers, None if there are none """
+    answers = [answer if isinstance(answer, bytes) else answer.encode('ascii')
+               for answer in answers if answer is not None]
+    if not answers:
+        return None
+    return b';'.join(answers) + b'\n'
+
+
+def format_block(data):
+    """ wraps data in an IEEE-488.2 definite length block header """
+    length = str(len(data))
+    return '#{0:d}{1}'.format(len(length), length).encode('ascii') + data
+
+
+def format_value(value):
+    """ formats a stored setting the way an instrument answers a query """
+    if isinstance(value, float):
+        return "{0:.12g}".format(value)
+    return str(value)
+
+
+class FakeInstrument(object):
+    """
+    model of a SCPI instrument which stores every setting it is sent
+
+    'HEAD value' stores value under HEAD and 'HEAD?' answers it. Subclasses
+    provide defaults, limits and handle special headers in execute.
+    """
+    idn = "Fake,Instrument,0,0"
+    defaults = {}
+    limits = {}
+
+    def __init__(self):
+        self.errors = []
+        self.reset()
+
+    def reset(self):
+        """ returns all settings to their defaults """
+        self.settings = dict(self.defaults)
+
+    def error(self, code, message):
+        """ pushes an error onto the error queue """
+        self.errors.append((code, message))
+
+    def execute(self, command):
+        """ executes one SCPI command, returns the answer or None """
+        header, _, arg = command.strip().partition(' ')
+        header = header.upper().lstrip(':')
+
+        if header == '*IDN?':
+            return self.idn
+        if header == '*OPC?':
+            return '1'
+        if header == '*RST':
+            self.reset()
+            return None
+        if header == '*CLS':
+            del self.errors[:]
+            return None
+        if header in ('*WAI', '*SRE', '*ESE'):
+            return None
+        if header in ('SYST:ERR?', 'SYSTEM:ERROR?'):
+            if self.errors:
+                return '{0:d},"{1}"'.format(*self.errors.pop(0))
+            return '0,"No error"'
+
+        if header.endswith('?'):
+            if header[:-1] not in self.settings:
+                self.error(-113, "Undefined header")
+                return '0'
+            return format_value(self.settings[header[:-1]])
+
+        value = parse_value(arg)
+        low, high = self.limits.get(header, (None, None))
+        if low is not None and not isinstance(value, float):
+            self.error(-104, "Data type error")
+            return None
+        if low is not None and not low <= value <= high:
+            self.error(-222, "Data out of range")
+            return None
+        self.settings[header] = value
+        return None
+
+
+class FakeBNC845(FakeInstrument):
+    """
+    BNC845 signal generator model
+
+    Supports list sweeps: ':LIST:POW p1,p2,...', ':LIST:DWEL', ':LIST:TRIG:SOUR'
+    and ':POW:MODE LIST'. ':INIT' starts the list at its first point, then each
+    '*TRG' (source BUS) or every dwell seconds (source IMM) steps to the next.
+    """
+    idn = "Berkeley Nucleonics,845,000000,0.0"
+    defaults = {'FREQ': 1E9, 'POW': -10.0, 'OUTP': 0.0, 'POW:MODE': 'FIX',
+                'LIST:DWEL': 1E-3, 'LIST:TRIG:SOUR': 'IMM'}
+    limits = {'POW': (-30.0, 25.0)}
+
+    def reset(self):
+        super(FakeBNC845, self).reset()
+        self.power_list = []
+        self.list_index = None
+        self.list_start = None
+
+    def _list_power(self):
+        """ current power of a running list sweep """
+        index = self.list_index
+        if self.settings['LIST:TRIG:SOUR'] == 'IMM':
+            index = int((time.time() - self.list_start) / self.settings['LIST:DWEL'])
+        return self.power_list[min(index, len(self.power_list) - 1)]
+
+    def execute(self, command):
+        header, _, arg = command.strip().partition(' ')
+        header = header.upper().lstrip(':')
+        running = self.settings['POW:MODE'] == 'LIST' and self.list_index is not None
+
+        if header == 'LIST:POW':
+            powers = [parse_value(power) for power in arg.split(',')]
+            low, high = self.limits['POW']
+            if not all(isinstance(power, float) and low <= power <= high for power in powers):
+                self.error(-222, "Data out of range")
+                return None
+            self.power_list = powers
+            self.list_index = None
+            return None
+        if header == 'LIST:POW?':
+            return ','.join(format_value(power) for power in self.power_list)
+        if header in ('POW:MODE', 'LIST:TRIG:SOUR'):
+            self.settings[header] = arg.strip().upper()
+            self.list_index = None
+            return None
+        if header in ('INIT', 'INIT:IMM'):
+            if self.settings['POW:MODE'] == 'LIST' and self.power_list:
+                self.list_index = 0
+                self.list_start = time.time()
+            return None
+        if header == '*TRG':
+            if running and self.settings['LIST:TRIG:SOUR'] == 'BUS':
+                self.list_index += 1
+            return None
+        if header == 'POW?' and running:
+            return format_value(self._list_power())
+        return super(FakeBNC845, self).execute(command)
+
+
+class SCPIHandler(socketserver.StreamRequestHandler):
+    """ reads newline terminated messages and writes back the answers """
+    def handle(self):
+        for line in iter(self.rfile.readline, b''):
+            reply = self.server.process(line.decode('ascii'))
+            if reply is not None:
+                self.wfile.write(reply)
+
+
+class SimulatorServer(socketserver.ThreadingTCPServer):
+    """
+    TCP server for a FakeInstrument
+
+    Parameters
+    ----------
+    instrument : FakeInstrument
+        model which executes the commands
+
+    addr : tuple ('ip.address', port), optional
+        address to listen on, by default a free local port
+
+    latency : float, optional
+        seconds of processing time added to every message
+
+    jitter : float, optional
+        up to this many more seconds are added at random to each message
+
+    Attributes
+    ----------
+    messages : int
+        number of messages received
+    round_trips : int
+        number of messages which were answered
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, instrument, addr=('127.0.0.1', 0), latency=0.0, handler=SCPIHandler,
+                 jitter=0.0):
+        socketserver.ThreadingTCPServer.__init__(self, addr, handler)
+        self.instrument = instrument
+        self.latency = latency
+        self.jitter = jitter
+        self.messages = 0
+        self.round_trips = 0
+        self._lock = threading.RLock()
+        self._thread = None
+
+    @property
+    def address(self):
+        """ (host, port) the server is listening on """
+        return self.server_address[:2]
+
+    def delay(self):
+        """ processing time of one message """
+        if self.jitter > 0.0:
+            return self.latency + random.uniform(0.0, self.jitter)
+        return self.latency
+
+    def process(self, message):
+        """ executes every command in message, returns the reply bytes or None """
+        with self._lock:
+            self.messages += 1
+            delay = self.delay()
+            if delay > 0.0:
+                time.sleep(delay)
+            answers = [self.instrument.execute(cmd) for cmd in message.strip().split(';')
+                       if cmd.strip()]
+            reply = join_answers(answers)
+            if reply is not None:
+                self.round_trips += 1
+            return reply
+
+    def reset_counts(self):
+        """ zeroes the message and round trip counters """
+        with self._lock:
+            self.messages = 0
+            self.round_trips = 0
+
+    def start(self):
+        """ serves in a background thread, returns self """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ stops serving and closes the listening socket """
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeFSP(FakeInstrument):
+    """
+    Rohde & Schwarz FSP spectrum analyzer model
+
+    The spectrum is a tone of signal_power dBm at the center frequency, one
+    resolution bandwidth wide, over a noise_floor dBm floor. Traces are sent as
+    ASCII or, after 'FORM REAL,32', as a little endian float block.
+    """
+    idn = "Rohde&Schwarz,FSP-7,000000/000,4.0"
+    defaults = {'FREQ:CENT': 1E9, 'FREQ:SPAN': 1E6, 'DISP:WIND:TRAC:Y:RLEV': -20.0,
+                'INIT:CONT': 1.0, 'SYST:DISP:UPD': 1.0, 'SWE:POIN': 501.0, 'BAND': 1E3,
+                'FORM': 'ASC', 'FORM:BORD': 'SWAP'}
+    signal_power = -30.0
+    noise_floor = -90.0
+
+    def trace(self):
+        """ returns the current trace in dBm """
+        import numpy as np
+        center, span = self.settings['FREQ:CENT'], self.settings['FREQ:SPAN']
+        freqs = np.linspace(center - span / 2, center + span / 2, int(self.settings['SWE:POIN']))
+        shape = np.exp(-.5 * ((freqs - center) / (self.settings['BAND'] / 2.355)) ** 2)
+        milliwatts = 10 ** (self.signal_power / 10.0) * shape + 10 ** (self.noise_floor / 10.0)
+        return 10 * np.log10(milliwatts)
+
+    def execute(self, command):
+        header, _, arg = command.strip().partition(' ')
+        header = header.upper()
+        if header in ('INIT', 'CALC:MARK:MAX'):
+            return None
+        if header == 'SENS:POW:ACH:PRES:RLEV':
+            # reference level about 5 dB above the signal, on a whole dB
+            self.settings['DISP:WIND:TRAC:Y:RLEV'] = float(int(self.signal_power + 6))
+            return None
+        if header == 'STAT:QUES:POW:COND?':
+            return '1' if self.signal_power > self.settings['DISP:WIND:TRAC:Y:RLEV'] else '0'
+        if header == 'CALC:MARK:Y?':
+            return format_value(float(self.trace().max()))
+        if header == 'CALC:MARK:X?':
+            return format_value(self.settings['FREQ:CENT'])
+        if header == 'FORM':
+            self.settings['FORM'] = arg.strip().upper()
+            return None
+        if header in ('TRAC?', 'TRAC:DATA?'):
+            trace = self.trace()
+            if self.settings['FORM'].startswith('REAL'):
+                return format_block(trace.astype('<f4').tobytes())
+            return ','.join(format_value(float(value)) for value in trace)
+        return super(FakeFSP, self).execute(command)
+
+
+def prologix_unescape(data):
+    """ removes the ESC characters added by interfaces.prologix_escape """
+    ret = bytearray()
+    escaped = False
+    for char in bytearray(data):
+        if char == 27 and not escaped:
+            escaped = True
+            continue
+        escaped = False
+        ret.append(char)
+    return bytes(ret)
+
+
+class PrologixHandler(socketserver.StreamRequestHandler):
+    """ reads lines ending in an unescaped LF and writes back the answers """
+    def handle(self):
+        line = b''
+        for chunk in iter(self.rfile.readline, b''):
+            line += chunk
+            body = line.rstrip(b'\n')
+            escapes = len(body) - len(body.rstrip(b'\x1b'))
+            if chunk.endswith(b'\n') and escapes % 2 == 1:
+                continue # the LF was escaped, it is part of the data
+            reply = self.server.process(line[:-1] if line.endswith(b'\n') else line)
+            line = b''
+            if reply is not None:
+                self.wfile.write(reply)
+
+
+class PrologixServer(SimulatorServer):
+    """
+    Prologix GPIB-Ethernet adapter emulator fronting FakeInstruments
+
+    Answers to device queries become available latency seconds after the
+    query arrives, so serial polls see MAV only once the instrument is done.
+
+    Parameters
+    ----------
+    instruments : dict
+        gpib address: FakeInstrument
+
+    Attributes
+    ----------
+    addr_switches : int
+        number of ++addr commands which changed the addressed instrument
+    polls : int
+        number of ++spoll and ++srq requests
+    """
+    MAV = 0x10
+    RQS = 0x40
+
+    def __init__(self, instruments, addr=('127.0.0.1', 0), latency=0.0, jitter=0.0):
+        SimulatorServer.__init__(self, None, addr, latency, PrologixHandler, jitter)
+        self.instruments = instruments
+        self.config = {'mode': '1', 'auto': '0', 'eos': '0', 'eoi': '1', 'addr': None}
+        self.outputs = dict((gpib_addr, []) for gpib_addr in instruments)
+        self.addr_switches = 0
+        self.polls = 0
+
+    def reset_counts(self):
+        with self._lock:
+            SimulatorServer.reset_counts(self)
+            self.addr_switches = 0
+            self.polls = 0
+
+    def process(self, message):
+        """ handles one adapter command or data line, returns reply bytes or None """
+        with self._lock:
+            self.messages += 1
+            if message.startswith(b'++'):
+                reply = self._command(message[2:].decode('ascii').strip())
+            else:
+                reply = self._data(prologix_unescape(message.rstrip(b'\r')))
+            if reply is not None:
+                self.round_trips += 1
+            return reply
+
+    def _addressed(self):
+        """ returns the currently addressed FakeInstrument's address """
+        gpib_addr = self.config['addr']
+        if gpib_addr not in self.instruments:
+            return None
+        return gpib_addr
+
+    def _status(self, gpib_addr):
+        """ status byte of instrument at gpib_addr """
+        outputs = self.outputs.get(gpib_addr)
+        if outputs and outputs[0][0] <= time.time():
+            return self.MAV | self.RQS
+        return 0
+
+    def _pop_output(self, gpib_addr):
+        """ waits until the oldest answer of gpib_addr is ready and returns it """
+        ready, output = self.outputs[gpib_addr].pop(0)
+        delay = ready - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        return output
+
+    def _command(self, command):
+        name, _, arg = command.partition(' ')
+        arg = arg.strip()
+        if name == 'addr':
+            if not arg:
+                return (str(self.config['addr']) + '\r\n').encode('ascii')
+            gpib_addr = int(arg.split()[0])
+            if gpib_addr != self.config['addr']:
+                self.addr_switches += 1
+            self.config['addr'] = gpib_addr
+            return None
+        if name == 'ver':
+            return b'Prologix GPIB-ETHERNET Controller version 01.06.06.00\r\n'
+        if name == 'read':
+            gpib_addr = self._addressed()
+            if gpib_addr is None or not self.outputs[gpib_addr]:
+                return None # the real adapter just times out
+            return self._pop_output(gpib_addr)
+        if name == 'spoll':
+            self.polls += 1
+            gpib_addr = int(arg.split()[0]) if arg else self._addressed()
+            return '{0:d}\r\n'.format(self._status(gpib_addr)).encode('ascii')
+        if name == 'srq':
+            self.polls += 1
+            asserted = any(self._status(gpib_addr) for gpib_addr in self.instruments)
+            return b'1\r\n' if asserted else b'0\r\n'
+        if name in ('rst', 'clr', 'ifc'):
+            return None
+        if arg:
+            self.config[name] = arg
+            return None
+        return (str(self.config.get(name, '')) + '\r\n').encode('ascii')
+
+    def _data(self, data):
+        gpib_addr = self._addressed()
+        if gpib_addr is None:
+            return None
+        instrument = self.instruments[gpib_addr]
+        answers = [instrument.execute(cmd) for cmd in data.decode('ascii').split(';')
+                   if cmd.strip()]
+        output = join_answers(answers)
+        if output is not None:
+            # the answer becomes available after the instrument's processing time
+            self.outputs[gpib_addr].append((time.time() + self.delay(), output))
+            if self.config['auto'] == '1':
+                return self._pop_output(gpib_addr)
+        return None
+
+
+class FakeCA(object):
+    """
+    stand-in for the pyepics functions adcutils uses (caget, caget_many,
+    camonitor and camonitor_clear)
+
+    Parameters
+    ----------
+    source : function(pvname), optional
+        returns the current value of a PV
+
+    period : float, optional
+        seconds between monitor updates, like the IOC's scan period
+
+    clock_offset : float, optional
+        seconds the IOC's clock (the timestamps of the updates) is ahead of ours
+
+    Attributes
+    ----------
+    gets : int
+        number of PVs read with caget/caget_many
+    posts : int
+        number of monitor updates sent
+    """
+    def __init__(self, source=None, period=.1, clock_offset=0.0):
+        self.source = source if source is not None else (lambda pvname: 0.0)
+        self.period = period
+        self.clock_offset = clock_offset
+        self.gets = 0
+        self.posts = 0
+        self._monitors = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def caget(self, pvname):
+        self.gets += 1
+        return self.source(pvname)
+
+    def caget_many(self, pvnames):
+        return [self.caget(pvname) for pvname in pvnames]
+
+    def camonitor(self, pvname, callback=None):
+        with self._lock:
+            self._monitors.setdefault(pvname, []).append(callback)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def camonitor_clear(self, pvname):
+        with self._lock:
+            self._monitors.pop(pvname, None)
+
+    def post(self):
+        """ sends the current value of every monitored PV to its callbacks """
+        now = time.time() + self.clock_offset
+        with self._lock:
+            monitors = list(self._monitors.items())
+        for pvname, callbacks in monitors:
+            value = self.source(pvname)
+            for callback in callbacks:
+                self.posts += 1
+                callback(pvname=pvname, value=value, timestamp=now)
+
+    def _run(self):
+        while not self._stop.wait(self.period):
+            self.post()
+
+    def stop(self):
+        """ stops sending monitor updates """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class ChassisModel(object):
+    """
+    signal path from a FakeBNC845 through the amplifier to the llrf1 adcs
+
+    The generator's power is converted with the gain files, unclipped so the
+    amplifier compresses above saturation: gain_file for what the spectrum
+    analyzer sees (plus fsp_offset dB) and each channel's own gain file for
+    the power at its input. A channel's adc amplitude is headroom dB below
+    full scale at its nominal input and clips at full scale, with noise counts
+    of gaussian noise.
+
+    Parameters
+    ----------
+    generator : FakeBNC845
+
+    channels : list of adcutils.Channel, optional
+        channels with adcs, all of adcutils.CHANNELS by default
+    """
+    FULL_SCALE = 32767
+
+    def __init__(self, generator, channels=None, gain_file='BNC_AMP30_ATN-0', headroom=4.0,
+                 noise=4.0, fsp_offset=0.0):
+        from adcutils import CHANNELS
+        self.generator = generator
+        self.channels = list(CHANNELS if channels is None else channels)
+        self.gain_file = gain_file
+        self.headroom = headroom
+        self.noise = noise
+        self.fsp_offset = fsp_offset
+        self._curves = {}
+
+    def _curve(self, gain_file):
+        """ (raws, reals) of gain_file, read once """
+        if gain_file not in self._curves:
+            import numpy as np
+            from gainmap import resolve_gain_file
+            raws, gains = np.loadtxt(resolve_gain_file(gain_file), unpack=True, usecols=[0, 1],
+                                     ndmin=2)
+            self._curves[gain_file] = (raws, raws + gains)
+        return self._curves[gain_file]
+
+    def raw_power(self):
+        """ generator output power, None while the output is off """
+        generator = self.generator
+        if not generator.settings['OUTP']:
+            return None
+        if generator.settings['POW:MODE'] == 'LIST' and generator.list_index is not None:
+            return generator._list_power()
+        return generator.settings['POW']
+
+    def real_power(self, gain_file=None):
+        """ power after gain_file (the amplifier's by default), None while off """
+        import numpy as np
+        raw_power = self.raw_power()
+        if raw_power is None:
+            return None
+        raws, reals = self._curve(self.gain_file if gain_file is None else gain_file)
+        return float(np.interp(raw_power, raws, reals))
+
+    def fsp_power(self):
+        """ power at the spectrum analyzer, None while off """
+        power = self.real_power()
+        return None if power is None else power + self.fsp_offset
+
+    def adc_values(self, adc):
+        """ (adc_min, adc_max) counts of adc """
+        channel = [channel for channel in self.channels if channel.adc == adc][0]
+        power = self.real_power(channel.gain_file)
+        amplitude = 0.0
+        if power is not None:
+            amplitude = min(1.0, 10 ** ((power - channel.nominal - self.headroom) / 20.0))
+        amplitude *= self.FULL_SCALE
+        adc_min = -amplitude - abs(random.gauss(0.0, self.noise))
+        adc_max = amplitude + abs(random.gauss(0.0, self.noise))
+        return (float(round(max(adc_min, -self.FULL_SCALE - 1))),
+                float(round(min(adc_max, self.FULL_SCALE))))
+
+    def pv_value(self, pvname):
+        """ value of an 'llrf1:adcN_min' or 'llrf1:adcN_max' PV """
+        adc, _, which = pvname.split(':')[-1].partition('_')
+        return self.adc_values(adc)[0 if which == 'min' else 1]
+
+
+class ModelFSP(FakeFSP):
+    """ FakeFSP whose signal power follows a ChassisModel """
+    def __init__(self, model):
+        self.model = model
+        super(ModelFSP, self).__init__()
+
+    @property
+    def signal_power(self):
+        power = self.model.fsp_power()
+        return self.noise_floor - 10.0 if power is None else power
+
+
+class SimulatorFarm(object):
+    """
+    the llrf1 test stand on local ports
+
+    A BNC845 server, a Prologix adapter with the FSP at spec_gpib and FakeCA
+    adcs, all driven by one ChassisModel.
+
+        with SimulatorFarm('BNC_AMP30_ATN-0', latency=.002) as farm:
+            gen = BNC845(SocketInterface(farm.gen_addr))
+            spec = RandSFSP(TempPrologixEnetInterface(*farm.spec_addr))
+            adc_vals('adc4', farm.ca)
+
+    Parameters
+    ----------
+    gain_file : str, optional
+        amplifier gain file, see ChassisModel
+
+    channels : list of adcutils.Channel, optional
+
+    latency, jitter : float, optional
+        processing time of every message, see SimulatorServer
+
+    ca_period : float, optional
+        seconds between adc monitor updates
+
+    fsp_offset : float, optional
+        dB between the amplifier and the spectrum analyzer
+    """
+    def __init__(self, gain_file='BNC_AMP30_ATN-0', channels=None, latency=0.0, jitter=0.0,
+                 ca_period=.1, fsp_offset=0.0, spec_gpib=18):
+        self.generator = FakeBNC845()
+        self.model = ChassisModel(self.generator, channels, gain_file, fsp_offset=fsp_offset)
+        self.gen_server = SimulatorServer(self.generator, latency=latency, jitter=jitter)
+        self.spec_server = PrologixServer({spec_gpib: ModelFSP(self.model)}, latency=latency,
+                                          jitter=jitter)
+        self.ca = FakeCA(self.model.pv_value, period=ca_period)
+        self.spec_gpib = spec_gpib
+
+    @property
+    def gen_addr(self):
+        """ (host, port) of the signal generator """
+        return self.gen_server.address
+
+    @property
+    def spec_addr(self):
+        """ (gpib address, (host, port)) of the spectrum analyzer """
+        return self.spec_gpib, self.spec_server.address
+
+    def counts(self):
+        """ messages, round trips, polls and caget counts since reset_counts """
+        return {'gen_messages': self.gen_server.messages,
+                'gen_round_trips': self.gen_server.round_trips,
+                'spec_messages': self.spec_server.messages,
+                'spec_round_trips': self.spec_server.round_trips,
+                'spec_polls': self.spec_server.polls,
+                'ca_gets': self.ca.gets}
+
+    def reset_counts(self):
+        """ zeroes every counter """
+        self.gen_server.reset_counts()
+        self.spec_server.reset_counts()
+        self.ca.gets = 0
+
+    def start(self):
+        """ starts the servers, returns self """
+        self.gen_server.start()
+        self.spec_server.start()
+        return self
+
+    def stop(self):
+        """ stops the servers and the adc monitors """
+        self.gen_server.stop()
+        self.spec_server.stop()
+        self.ca.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """ shows the messages and round trips saved by batching BNC845 commands """
+    from interfaces import SocketInterface
+    from bncinst import BNC845
+
+    powers = [-30 + i * .45 for i in range(101)]
+    with SimulatorServer(FakeBNC845(), latency=.002) as server:
+        gen = BNC845(SocketInterface(server.address))
+
+        def run(name, step):
+            server.reset_counts()
+            start = time.time()
+            for power in powers:
+                step(power)
+            print("{0:<12}{1:>5d} messages {2:>5d} round trips {3:>7.3f} s".format(
+                name, server.messages, server.round_trips, time.time() - start))
+
+        def sequential(power):
+            gen.set_power(power)
+            gen.get_freq()
+            gen.signal_on
+
+        def batched(power):
+            with gen.batch():
+                gen.set_power(power, check=False)
+                gen.query_many([':POW?', ':FREQ?', ':OUTP?'])
+
+        run("sequential", sequential)
+        run("batched", batched)
+
+
+if __name__ == '__main__':
+    main()
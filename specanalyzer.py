@@ -1,6 +1,9 @@
 """ provides general spectrum analyzer classes """
 from __future__ import print_function
-from devices import BaseDevice
+import numpy as np
+from devices import BaseDevice, cached_setting
+
+OVERLOAD = 0x1 # STAT:QUES:POW overload bit
 
 class SpectrumAnalyzer(BaseDevice):
     """ generic spectrum analyzer class """
@@ -83,13 +86,27 @@ class RandSFSP(SpectrumAnalyzer):
     Returns
     -------
     RandSFSP spectrum analyzer object
+
+    Window settings are cached (see devices.cached_setting) so reading them
+    back after setting them costs no round trips.
+
+    get_peak reads the reference level with the peak and only re-runs the
+    (slow) automatic reference level when the peak leaves the band
+    ref_headroom (min, max dB below the reference level) or the analyzer
+    flags overload. The reference level isn't cached since auto reference
+    level (or another client) changes it.
+    auto_ref_count and auto_ref_skipped count how often it ran or was skipped.
     """
+    ref_headroom = (1.0, 15.0)
+
     def __init__(self, interface):
         super(RandSFSP, self).__init__(interface)
         self.read_termination = '\n'
         self.timeout = 15000
+        self.auto_ref_count = 0
+        self.auto_ref_skipped = 0
 
-    @property
+    @cached_setting
     def center_frequency(self):
         """ get window center frequency (Hz)"""
         return float(self.query("*WAI;FREQ:CENT?"))
@@ -99,7 +116,7 @@ class RandSFSP(SpectrumAnalyzer):
         """ center frequency setter (Hz) """
         self.write("*WAI;FREQ:CENT {0:.2f}MHz".format(value/1E6))
 
-    @property
+    @cached_setting
     def span(self):
         """ get window span (Hz)"""
         return float(self.query("*WAI;FREQ:SPAN?"))
@@ -109,7 +126,7 @@ class RandSFSP(SpectrumAnalyzer):
         """ set window span (Hz) """
         self.write("*WAI;FREQ:SPAN {0:.2f}Hz".format(value))
 
-    @property
+    @cached_setting(volatile=True)
     def reference_level(self):
         """ get reference level (dBm) """
         return float(self.query("*WAI;DISP:WIND:TRAC:Y:RLEV?"))
@@ -119,7 +136,7 @@ class RandSFSP(SpectrumAnalyzer):
         """ set reference level (dBm) """
         self.write("*WAI;DISP:WIND:TRAC:Y:RLEV {0:.2f}dBm".format(value))
 
-    @property
+    @cached_setting
     def continuous_sweep(self):
         """ return true if continuous sweep on """
         return bool(int(self.query("INIT:CONT?")))
@@ -140,7 +157,22 @@ class RandSFSP(SpectrumAnalyzer):
         return float(power)
 
     def get_peak(self):
-        """ returns current peak power after adjusting reference level """
+        """
+        returns current peak power, adjusting the reference level first if the
+        last known one doesn't suit the peak
+        """
+        # take a sweep (unless sweeping continuously), read the peak, the
+        # overload condition and the reference level in one round trip
+        sweep = "" if self.settings_cache.get('continuous_sweep') else "INIT;*WAI;"
+        power, cond, ref_level = self.query_many([sweep + "CALC:MARK:MAX;*WAI;CALC:MARK:Y?",
+                                                  "STAT:QUES:POW:COND?",
+                                                  "DISP:WIND:TRAC:Y:RLEV?"])
+        power, ref_level = float(power), float(ref_level)
+        low, high = self.ref_headroom
+        if not int(cond) & OVERLOAD and ref_level - high <= power <= ref_level - low:
+            self.auto_ref_skipped += 1
+            return power
+
         self.auto_ref_lvl()
         return self.peak_power()
 
@@ -149,14 +181,62 @@ class RandSFSP(SpectrumAnalyzer):
         freq = self.query("CALC:MARK:MAX;*WAI;CALC:MARK:X?")
         return float(freq)
 
+    def read_trace(self, trace=1):
+        """
+        returns the trace as an array of dBm values
+
+        the whole trace is transferred as one REAL,32 block and wrapped in the
+        array without copying
+        """
+        data = self.query_block("FORM REAL,32;FORM:BORD SWAP;TRAC? TRACE{0:d}".format(trace))
+        return np.frombuffer(data, dtype='<f4')
+
+    def trace_frequencies(self, points):
+        """ returns the frequency (Hz) of each of the points of a trace """
+        cache = self.settings_cache
+        if 'center_frequency' not in cache or 'span' not in cache:
+            center, span = self.query_many(["FREQ:CENT?", "FREQ:SPAN?"])
+            cache['center_frequency'], cache['span'] = float(center), float(span)
+        center, span = cache['center_frequency'], cache['span']
+        return np.linspace(center - span / 2, center + span / 2, points)
+
+    def trace_peak(self, powers=None):
+        """
+        returns (peak power in dBm, peak frequency in Hz) computed from a trace
+        read with read_trace (read now if powers is None)
+        """
+        powers = self.read_trace() if powers is None else powers
+        index = int(np.argmax(powers))
+        return float(powers[index]), float(self.trace_frequencies(len(powers))[index])
+
+    def band_power(self, low=None, high=None, powers=None):
+        """
+        returns the power (dBm) integrated between low and high (Hz, defaults
+        to the whole span) from a trace read with read_trace (read now if
+        powers is None)
+        """
+        powers = self.read_trace() if powers is None else powers
+        freqs = self.trace_frequencies(len(powers))
+        rbw = float(self.query("BAND?"))
+        low = freqs[0] if low is None else low
+        high = freqs[-1] if high is None else high
+        in_band = (freqs >= low) & (freqs <= high)
+        if not np.any(in_band):
+            raise ValueError("no trace points between {0} and {1} Hz".format(low, high))
+        bin_width = freqs[1] - freqs[0] if len(freqs) > 1 else rbw
+        # each point measures the power in one resolution bandwidth
+        milliwatts = np.sum(10 ** (powers[in_band] / 10.0)) * bin_width / rbw
+        return float(10 * np.log10(milliwatts))
+
     def display_on(self, disp_on=True):
         """ turns display on or off """
         arg = "ON" if disp_on else "OFF"
         self.write("SYST:DISP:UPD " + arg + ";*WAI")
 
     def auto_ref_lvl(self):
-        """ """
+        """ sets the reference level automatically """
         self.sync_cmd("SENS:POW:ACH:PRES:RLEV")
+        self.auto_ref_count += 1
 
     def sync_cmd(self, cmd):
         """ queries operation complete after sending command """
@@ -173,4 +253,5 @@ class RandSFSP(SpectrumAnalyzer):
     def rst(self):
         """ resets system """
         self.write("*RST;*WAI")
+        self.invalidate()
 
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from adcutils import ADCMonitor, adc_vals, adc_vals_many, adc_pvs, which_channels, CHANNELS
+from simulators import FakeCA
+
+
+class Source(object):
+    """ adc PV values, adc_min = -level and adc_max = level """
+    def __init__(self, level=100.0):
+        self.level = level
+
+    def __call__(self, pvname):
+        return -self.level if pvname.endswith('_min') else self.level
+
+
+@pytest.fixture
+def source():
+    return Source()
+
+
+def make_ca(source, **kwargs):
+    # a long period so only explicit post() calls send updates
+    kwargs.setdefault('period', 1000)
+    return FakeCA(source, **kwargs)
+
+
+@pytest.fixture
+def monitor(source):
+    ca = make_ca(source)
+    monitor = ADCMonitor(['adc4', 'adc3'], ca=ca)
+    yield ca, monitor
+    monitor.close()
+    ca.stop()
+
+
+def post_later(ca, delay, before=None):
+    def post():
+        time.sleep(delay)
+        if before is not None:
+            before()
+        ca.post()
+    thread = threading.Thread(target=post)
+    thread.start()
+    return thread
+
+
+def test_adc_vals_batches_reads(source):
+    ca = make_ca(source)
+    assert adc_vals('adc4', ca) == (-100.0, 100.0)
+    assert adc_vals_many(['adc4', 'adc3', 'adc4'], ca) == {'adc4': (-100.0, 100.0),
+                                                           'adc3': (-100.0, 100.0)}
+    assert ca.gets == 2 + 4
+
+
+def test_snapshot_pairs_min_and_max(monitor, source):
+    ca, monitor = monitor
+    assert monitor.snapshot('adc4') is None
+    before = time.time()
+    ca.post()
+    adc_min, adc_max, arrival = monitor.snapshot('adc4')
+    assert (adc_min, adc_max) == (-100.0, 100.0)
+    assert before <= arrival <= time.time()
+    source.level = 200.0
+    ca.post()
+    assert monitor.values('adc3') == (-200.0, 200.0)
+
+
+def test_values_falls_back_to_caget(monitor):
+    ca, monitor = monitor
+    assert monitor.values('adc4') == (-100.0, 100.0)
+    assert ca.gets == len(adc_pvs('adc4'))
+
+
+def test_wait_update_returns_first_new_values(monitor, source):
+    ca, monitor = monitor
+    ca.post()
+    start = time.time()
+    thread = post_later(ca, .1, lambda: setattr(source, 'level', 300.0))
+    assert monitor.wait_update('adc4', start, timeout=5) == (-300.0, 300.0)
+    assert time.time() - start < 2
+    thread.join()
+
+
+@pytest.mark.parametrize('clock_offset', [-3600.0, 3600.0])
+def test_wait_update_ignores_ioc_clock(source, clock_offset):
+    ca = make_ca(source, clock_offset=clock_offset)
+    monitor = ADCMonitor(['adc4'], ca=ca)
+    try:
+        ca.post()
+        # an update from before the step is stale whatever the IOC's clock says
+        with pytest.warns(UserWarning, match='no new adc4'):
+            monitor.wait_update('adc4', time.time(), timeout=.1)
+        start = time.time()
+        thread = post_later(ca, .05)
+        monitor.wait_update('adc4', start, timeout=5)
+        assert time.time() - start < 2
+        thread.join()
+    finally:
+        monitor.close()
+        ca.stop()
+
+
+def test_wait_update_times_out_with_warning(monitor):
+    ca, monitor = monitor
+    start = time.time()
+    with pytest.warns(UserWarning, match='no new adc4 values'):
+        values = monitor.wait_update('adc4', start, timeout=.1)
+    assert values == (-100.0, 100.0)
+    assert time.time() - start >= .1
+
+
+def test_which_channels():
+    assert which_channels('0,2,0') == [CHANNELS[0], CHANNELS[2]]
+    assert which_channels('all') == CHANNELS
+    with pytest.raises(ValueError):
+        which_channels('0,x')
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from asyncdevices import AsyncDevice, open_device
+from bncinst import BNC845
+from interfaces import SocketInterface
+from simulators import SimulatorServer, FakeBNC845
+
+
+class RecordingServer(SimulatorServer):
+    """ keeps every message it receives """
+    def __init__(self, *args, **kwargs):
+        SimulatorServer.__init__(self, *args, **kwargs)
+        self.received = []
+
+    def process(self, message):
+        self.received.append(message.strip())
+        return SimulatorServer.process(self, message)
+
+
+def opener(server):
+    return lambda: BNC845(SocketInterface(server.address, timeout=2000))
+
+
+def test_devices_overlap():
+    async def run(first, second):
+        gens = [await open_device(opener(first)), await open_device(opener(second))]
+        start = time.time()
+        await asyncio.gather(*[gen.get_power() for gen in gens])
+        elapsed = time.time() - start
+        for gen in gens:
+            gen.close()
+        return elapsed
+
+    with SimulatorServer(FakeBNC845(), latency=.2) as first, \
+         SimulatorServer(FakeBNC845(), latency=.2) as second:
+        # one query each, .2 s apiece when run one after the other
+        assert asyncio.run(run(first, second)) < .35
+
+
+def test_calls_to_one_device_stay_in_order():
+    async def run(server):
+        gen = AsyncDevice(opener(server)())
+        answers = await asyncio.gather(*[gen.set_power(power, check=True)
+                                         for power in range(-10, 0)])
+        power = await gen.get_power()
+        gen.close()
+        return answers, power
+
+    with RecordingServer(FakeBNC845(), jitter=.01) as server:
+        answers, power = asyncio.run(run(server))
+    assert answers == [None] * 10
+    assert power == -1
+    assert server.received == [':POW {0:d};:POW?'.format(power) for power in range(-10, 0)] + \
+        [':POW?']
@@ -0,0 +1,19 @@
+import argparse
+
+import pytest
+
+import benchmark
+
+
+@pytest.fixture
+def options():
+    return argparse.Namespace(channel=0, channels='0,1', min=10.0, max=20.0, profile_max=0.0,
+                              points=5, latency=0, jitter=0, ca_period=.01, trace=None)
+
+
+@pytest.mark.parametrize('scenario', benchmark.SCENARIOS)
+def test_scenario_runs_on_the_farm(options, scenario):
+    metrics = benchmark.run_scenario(scenario, options, [])
+    assert metrics['points'] > 0
+    assert metrics['queries'] > 0
+    assert metrics['gen_round_trips'] > 0
@@ -0,0 +1,121 @@
+import pytest
+
+import gainmap
+from bncinst import BNC845
+from gainmap import GainStats
+from interfaces import SocketInterface
+from settle import FixedSettle
+from signalgenerator import SweepPlan, SweepReport
+from simulators import SimulatorServer, FakeBNC845
+
+
+@pytest.fixture
+def server():
+    with SimulatorServer(FakeBNC845()) as server:
+        yield server
+
+
+@pytest.fixture
+def gen(server):
+    return BNC845(SocketInterface(server.address, timeout=2000))
+
+
+def test_sampled_verify_counts_each_setting(server, gen):
+    gen.verify, gen.verify_every = 'sampled', 3
+    for i in range(6):
+        gen.set_freq(100 + i)
+        gen.set_power(-10 + i)
+    # every third frequency and every third power is read back
+    assert server.round_trips == 4
+
+
+def test_list_sweep_steps_every_point(server, gen):
+    powers = []
+    plan = SweepPlan(gen, [-10, -5, 0], rf_settle=0)
+    report = gen.list_sweep(plan, lambda raw, real, state: powers.append(
+        float(gen.query(':POW?'))))
+    assert report.points == 3
+    assert powers == [-10, -5, 0]
+
+
+def test_grid_profile_rewrites_gain_file_in_gain_dir(tmp_path, monkeypatch, gen):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gainmap, 'GAIN_DIR', str(tmp_path / 'gain_files'))
+    (tmp_path / 'gain_files').mkdir()
+    (tmp_path / 'gain_files' / 'amp').write_text(u"-10 30 0\n0 30 0\n")
+    gen.configure(-20, 10)
+    gen.profile('amp', [-10, -5], lambda: float(gen.query(':POW?')) + 30, runs=1)
+    assert not (tmp_path / 'amp').exists()
+    assert GainStats.load(str(tmp_path / 'gain_files' / 'amp')).arrays()[0].tolist() == [-10, -5]
+
+
+def test_refine_profile_refines_an_existing_gain_file(tmp_path, gen):
+    gain = lambda raw: 30 - (raw / 5.0) ** 2
+    path = tmp_path / 'amp'
+    path.write_text(u"".join("{0} {1} 0 3\n".format(raw, gain(raw)) for raw in range(-20, 11, 2)))
+    gen.configure(-30, 15)
+    real_power = lambda: float(gen.query(':POW?')) + gain(float(gen.query(':POW?')))
+    measured = gen.refine_profile(str(path), real_power, -20, 10, target_error=.01,
+                                  max_points=20)
+    assert measured > 0
+    raws = GainStats.load(str(path)).arrays()[0]
+    assert raws.size > 16
+
+
+@pytest.mark.parametrize('sweep, round_trips', [('power_sweep', 1), ('list_sweep', 2)])
+def test_deferred_sweep_ignores_earlier_errors(server, gen, sweep, round_trips):
+    server.instrument.error(-222, "Data out of range")
+    plan = SweepPlan(gen, [-10, -5], rf_settle=0)
+    report = getattr(gen, sweep)(plan, lambda raw, real, state: None, verify='deferred')
+    assert report.errors == []
+    # clearing the queue costs no round trip, reading it (and the last list point) do
+    assert server.round_trips == round_trips
+
+
+def test_deferred_sweep_reports_its_own_errors(server, gen):
+    plan = SweepPlan(gen, [-10, -5], rf_settle=0)
+    report = gen.power_sweep(plan, lambda raw, real, state: gen.write(':POW 99'),
+                             verify='deferred')
+    assert [code for code, _ in report.errors] == [-222, -222]
+
+
+def test_failed_set_during_sweep_is_not_cached(server, gen):
+    server.instrument.limits = dict(FakeBNC845.limits, FREQ=(1E6, 2E9))
+    gen.raw_frequency = 1.5E9
+    assert gen.settings_cache['raw_frequency'] == 1.5E9
+    gen._report = report = SweepReport(SweepPlan(gen, [-10]), FixedSettle())
+    gen.raw_frequency = 5E9
+    gen._report = None
+    assert len(report.failures) == 1
+    assert 'raw_frequency' not in gen.settings_cache
+    assert gen.raw_frequency == 1.5E9
+
+
+def profile_runs(gen, path, noisy, runs):
+    """ profiles -10, -7.33.. and -5 with the gain at noisy alternating by +-.5 dB """
+    measured = []
+
+    def real_power():
+        raw = float(gen.query(':POW?'))
+        measured.append(raw)
+        flip = .5 if len(measured) % 2 else -.5
+        return raw + 30 + (flip if round(raw, 2) in noisy else 0)
+
+    points = gen.profile(path, [-10, -22 / 3.0, -5], real_power, runs=runs, max_stderr=.01)
+    return points, measured
+
+
+def test_profile_stops_measuring_converged_points(tmp_path, gen):
+    gen.configure(-20, 10)
+    points, measured = profile_runs(gen, str(tmp_path / 'amp'), [-5], runs=4)
+    # every point twice, then only the noisy one
+    assert points == 8
+    assert [round(raw, 2) for raw in measured[6:]] == [-5, -5]
+    raws, counts = GainStats.load(str(tmp_path / 'amp')).arrays()[:2]
+    assert raws.tolist() == [-10, -7.33, -5] and counts.tolist() == [2, 2, 4]
+
+
+def test_profile_ends_once_every_point_converged(tmp_path, gen):
+    gen.configure(-20, 10)
+    points, measured = profile_runs(gen, str(tmp_path / 'amp'), [], runs=5)
+    assert points == 6 and len(measured) == 6
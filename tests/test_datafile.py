@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+from datafile import (SweepWriter, TextWriter, Journal, read_sweep, read_rows, load_checkpoint,
+                      open_writer, save_json, convert_text, CHECKPOINT_EXTENSION)
+from catalog import Catalog
+
+ROWS = [(-10.0 + i, 20.0 + i, -100.0 * i, 100.0 * i) for i in range(7)]
+
+
+@pytest.fixture
+def sweep_path(tmp_path):
+    return str(tmp_path / 'REV_Cavity-2024-1-2-3-4.sweep')
+
+
+def test_sweep_round_trip(sweep_path):
+    with SweepWriter(sweep_path, buffer_points=3, channel='REV Cavity') as writer:
+        for row in ROWS:
+            writer.write(*row)
+    header, rows = read_sweep(sweep_path)
+    assert header['channel'] == 'REV Cavity'
+    np.testing.assert_array_equal(rows, ROWS)
+    np.testing.assert_array_equal(read_sweep(sweep_path, mmap=False)[1], ROWS)
+
+
+def test_truncated_tail_is_ignored_and_dropped_on_append(sweep_path):
+    with SweepWriter(sweep_path) as writer:
+        for row in ROWS[:3]:
+            writer.write(*row)
+    # an interrupted write leaves part of a row
+    with open(sweep_path, 'ab') as sweep_file:
+        sweep_file.write(b'\x00' * 12)
+    assert len(read_rows(sweep_path)) == 3
+    with SweepWriter(sweep_path) as writer:
+        assert writer.points == 3
+        writer.write(*ROWS[3])
+    np.testing.assert_array_equal(read_rows(sweep_path), ROWS[:4])
+
+
+@pytest.mark.parametrize('text', [False, True])
+def test_journal_checkpoint_and_resume(tmp_path, text):
+    names = ['REV_Cavity-2024-1-2-3-4', 'FWD_Cavity-2024-1-2-3-4']
+    paths = [str(tmp_path / (name + ('' if text else '.sweep'))) for name in names]
+    writers = [TextWriter(path) if text else SweepWriter(path) for path in paths]
+    journal = Journal(writers, state={'args': {'points': 7}}, sync_points=2)
+    for row in ROWS[:5]:
+        for writer in writers:
+            writer.write(*row)
+        journal.point_done()
+    # point 5 is written by the first writer only when the sweep dies
+    writers[0].write(*ROWS[5])
+    for writer in writers:
+        writer.flush()
+
+    checkpoint = load_checkpoint(paths[0])
+    assert checkpoint['points'] == 4
+    assert checkpoint['files'] == paths
+    assert checkpoint['args'] == {'points': 7}
+
+    writers = [open_writer(path) for path in checkpoint['files']]
+    for writer in writers:
+        writer.truncate(checkpoint['points'])
+    journal = Journal(writers, sync_points=2)
+    for row in ROWS[4:]:
+        for writer in writers:
+            writer.write(*row)
+        journal.point_done()
+    journal.close(complete=True)
+    assert not os.path.exists(paths[0] + CHECKPOINT_EXTENSION)
+    for path in paths:
+        np.testing.assert_allclose(read_rows(path), ROWS)
+
+
+def test_save_json_leaves_no_data_file_behind(tmp_path):
+    path = str(tmp_path / 'REV_Cavity-2024-1-2-3-4.sweep.ckpt')
+    save_json(path, {'points': 1})
+    assert os.listdir(str(tmp_path)) == [os.path.basename(path)]
+    # a temp file left by an interrupted write isn't cataloged as a measurement
+    open(str(tmp_path / 'REV_Cavity-2024-1-2-3-4.sweep.ckpt.tmp'), 'w').close()
+    open(str(tmp_path / '.REV_Cavity-2024-1-2-3-4.sweep.ckpt.tmp'), 'w').close()
+    with Catalog(str(tmp_path)) as catalog:
+        assert catalog.update() == 0
+
+
+def test_convert_text(tmp_path):
+    path = str(tmp_path / 'REV_Cavity-2024-1-2-3-4')
+    with open(path, 'w') as text_file:
+        for row in ROWS:
+            text_file.write(" ".join(str(value) for value in row) + "\n")
+    header, rows = read_sweep(convert_text(path))
+    assert header['channel'] == 'REV Cavity'
+    np.testing.assert_array_equal(rows, ROWS)
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from bncinst import BNC845
+from devices import parse_block, count_queries
+from interfaces import SocketInterface
+from simulators import SimulatorServer, FakeBNC845, FakeFSP, format_block
+from specanalyzer import RandSFSP
+
+
+def test_parse_block():
+    data = np.arange(5, dtype='<f4').tobytes()
+    block = parse_block(format_block(data) + b'\n')
+    assert isinstance(block, memoryview)
+    assert block.tobytes() == data
+
+
+def test_parse_empty_block():
+    assert parse_block(b'#10').tobytes() == b''
+
+
+@pytest.mark.parametrize('answer, message', [
+    (b'1.5,2.5\n', 'not a definite length block'),
+    (b'#0abc\n', 'indefinite length'),
+    (b'#3', 'bad block length'),
+    (b'#2x1ab', 'bad block length'),
+    (b'#15abc', 'short'),
+])
+def test_parse_block_errors(answer, message):
+    with pytest.raises(ValueError, match=message):
+        parse_block(answer)
+
+
+def test_read_trace_reasserts_binary_format():
+    instrument = FakeFSP()
+    with SimulatorServer(instrument) as server:
+        spec = RandSFSP(SocketInterface(server.address, timeout=2000))
+        first = spec.read_trace()
+        # another client switches the analyzer back to ASCII traces
+        instrument.execute('FORM ASC')
+        trace = spec.read_trace()
+    assert trace.dtype == np.dtype('<f4') and trace.size == 501
+    np.testing.assert_array_equal(trace, first)
+
+
+@pytest.fixture
+def fsp():
+    instrument = FakeFSP()
+    with SimulatorServer(instrument) as server:
+        spec = RandSFSP(SocketInterface(server.address, timeout=2000))
+        yield instrument, spec
+
+
+def test_get_peak_skips_auto_ref_when_level_suits(fsp):
+    instrument, spec = fsp
+    instrument.signal_power = -30.0
+    spec.get_peak()
+    assert spec.get_peak() == pytest.approx(-30.0, abs=.1)
+    assert spec.auto_ref_count <= 1 and spec.auto_ref_skipped >= 1
+
+
+def test_get_peak_sees_reference_level_changed_elsewhere(fsp):
+    instrument, spec = fsp
+    instrument.signal_power = -30.0
+    spec.get_peak()
+    count = spec.auto_ref_count
+    # another client lowers the reference level below the signal
+    instrument.execute('DISP:WIND:TRAC:Y:RLEV -60')
+    spec.get_peak()
+    assert spec.auto_ref_count == count + 1
+    assert spec.reference_level == instrument.settings['DISP:WIND:TRAC:Y:RLEV']
+
+
+class RecordingServer(SimulatorServer):
+    """ keeps every message it receives """
+    def __init__(self, *args, **kwargs):
+        SimulatorServer.__init__(self, *args, **kwargs)
+        self.received = []
+
+    def process(self, message):
+        self.received.append(message.strip())
+        return SimulatorServer.process(self, message)
+
+
+@pytest.fixture
+def bnc():
+    with RecordingServer(FakeBNC845()) as server:
+        gen = BNC845(SocketInterface(server.address, timeout=2000))
+        gen.read_termination = '\n'
+        yield server, gen
+
+
+def sent(server, gen):
+    """ messages the server received before a final *OPC? """
+    gen.query("*OPC?")
+    return server.received[:-1]
+
+
+def test_count_queries_checks_the_header():
+    assert count_queries(":POW? MAX;:FREQ?;:OUTP ON") == 2
+    assert count_queries("TRAC? TRACE1") == 1
+    assert count_queries(":POW -10;;") == 0
+
+
+def test_query_many_maps_answers_to_messages(bnc):
+    _, gen = bnc
+    assert gen.query_many([":POW -5", ":POW? MAX", ":FREQ?"]) == [None, "-5", "1000000000"]
+
+
+def test_query_many_without_queries_writes(bnc):
+    server, gen = bnc
+    assert gen.query_many([":POW -5", ":OUTP ON"]) == [None, None]
+    assert sent(server, gen) == [":POW -5;:OUTP ON"]
+
+
+def test_nested_batches_flush_at_the_outermost_exit(bnc):
+    server, gen = bnc
+    with gen.batch():
+        gen.write(":POW -5")
+        with gen.batch():
+            gen.write(":OUTP ON")
+        assert gen._pending == [":POW -5", ":OUTP ON"]
+    assert sent(server, gen) == [":POW -5;:OUTP ON"]
+
+
+def test_batch_prefixes_writes_to_the_next_query(bnc):
+    server, gen = bnc
+    with gen.batch():
+        gen.write(":POW -5")
+        assert gen.query(":POW?") == "-5"
+    assert server.received == [":POW -5;:POW?"]
+    assert server.round_trips == 1
+
+
+def test_failed_batch_drops_its_writes(bnc):
+    server, gen = bnc
+    with pytest.raises(RuntimeError):
+        with gen.batch():
+            gen.write(":OUTP ON")
+            raise RuntimeError
+    gen.write(":POW -5")
+    assert sent(server, gen) == [":POW -5"]
+
+
+def test_write_with_termination_sends_the_queue_first(bnc):
+    server, gen = bnc
+    with gen.batch():
+        gen.write(":POW -5")
+        gen.write(":OUTP ON", termination="\n")
+    assert sent(server, gen) == [":POW -5", ":OUTP ON"]
@@ -0,0 +1,85 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from gainmap import GainMap, GainStats, next_points
+
+SATURATING = "0 10 0\n1 10 0\n2 9.5 0\n3 8 0\n"
+
+
+@pytest.fixture
+def saturating(tmp_path):
+    path = tmp_path / 'gain'
+    path.write_text(SATURATING)
+    return str(path)
+
+
+def test_load_clips_saturation(saturating):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        gain_map = GainMap.load(saturating)
+    assert list(gain_map.raws) == [0, 1, 2]
+
+
+def test_load_cache_depends_on_clip(saturating):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        clipped = GainMap.load(saturating)
+    with pytest.raises(ValueError):
+        GainMap.load(saturating, clip=False)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        assert GainMap.load(saturating) is clipped
+
+
+def test_conversions_round_trip(tmp_path):
+    path = tmp_path / 'gain'
+    path.write_text("-10 30 0\n0 30 0\n10 28 0\n")
+    gain_map = GainMap.load(str(path))
+    assert gain_map.raw_to_real(5) == pytest.approx(34.0)
+    assert gain_map.real_to_raw(34.0) == pytest.approx(5)
+    with pytest.raises(ValueError):
+        gain_map.raw_to_real(11)
+
+
+def test_stats_save_load_round_trip(tmp_path):
+    stats = GainStats()
+    for gain in (10.0, 10.2, 10.4):
+        stats.add(-5, gain)
+    stats.add(0, 9.0)
+    path = str(tmp_path / 'gain')
+    stats.save(path)
+    raws, counts, means, stds = GainStats.load(path).arrays()
+    assert raws.tolist() == [-5, 0]
+    assert counts.tolist() == [3, 1]
+    assert means == pytest.approx([10.2, 9.0])
+    assert stds == pytest.approx([np.std([10.0, 10.2, 10.4]), 0], abs=.005)
+
+
+def test_stats_load_without_count_column(tmp_path):
+    path = tmp_path / 'gain'
+    path.write_text(u"0 10 0.1\n")
+    stats = GainStats.load(str(path))
+    assert stats.arrays()[1].tolist() == [3]
+    assert stats.add(0, 10) == 4
+
+
+def test_next_points_splits_curved_intervals():
+    stats = GainStats()
+    for raw in (-10, -5, 0, 5, 10):
+        for _ in range(3):
+            stats.add(raw, 10 - (raw / 5.0) ** 2)
+    raws, error = next_points(stats, -10, 10, target_error=.05)
+    assert raws.tolist() == [-7.5, -2.5, 2.5, 7.5]
+    assert error > .05
+
+
+def test_next_points_done_on_a_straight_map():
+    stats = GainStats()
+    for raw in (-10, 0, 10):
+        for _ in range(3):
+            stats.add(raw, 10 + raw / 10.0)
+    raws, error = next_points(stats, -10, 10, target_error=.05)
+    assert raws.size == 0
+    assert error == pytest.approx(0)
@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+import pytest
+from six.moves import socketserver
+
+from interfaces import SocketInterface
+from simulators import SimulatorServer, FakeFSP, format_block
+
+
+class ScriptHandler(socketserver.StreamRequestHandler):
+    """ answers each line with the next list of chunks in server.instrument """
+    def handle(self):
+        for _ in iter(self.rfile.readline, b''):
+            for chunk in self.server.instrument.pop(0):
+                self.wfile.write(chunk)
+                time.sleep(.02)
+
+
+@pytest.fixture
+def fsp():
+    with SimulatorServer(FakeFSP()) as server:
+        interface = SocketInterface(server.address, timeout=2000)
+        interface.read_termination = '\n'
+        yield interface
+
+
+def scripted(replies):
+    return SimulatorServer(replies, handler=ScriptHandler)
+
+
+def test_reads_terminated_answers(fsp):
+    fsp.write_raw(b'*IDN?\n')
+    assert fsp.read_raw() == FakeFSP.idn.encode('ascii') + b'\n'
+
+
+def test_block_with_terminator_leaves_next_answer(fsp):
+    fsp.write_raw(b'SWE:POIN 1001;FORM REAL,32;TRAC?\n')
+    block = fsp.read_raw()
+    assert block.startswith(b'#44004') and len(block) == 2 + 4 + 4004 + 1
+    fsp.write_raw(b'*IDN?\n')
+    assert fsp.read_raw().startswith(b'Rohde')
+
+
+def test_block_containing_terminator_bytes():
+    data = b'\n' * 10
+    with scripted([[format_block(data) + b'\n']]) as server:
+        interface = SocketInterface(server.address, timeout=2000)
+        interface.read_termination = '\n'
+        interface.write_raw(b'TRAC?\n')
+        assert interface.read_raw() == format_block(data) + b'\n'
+
+
+def test_block_without_terminator_is_returned():
+    block = format_block(np.arange(4, dtype='<f4').tobytes())
+    with scripted([[block], [b'\n', b'1\n']]) as server:
+        interface = SocketInterface(server.address, timeout=500)
+        interface.read_termination = '\n'
+        interface.write_raw(b'TRAC?\n')
+        assert interface.read_raw() == block
+        # the late terminator of the block is dropped
+        interface.write_raw(b'*OPC?\n')
+        assert interface.read_raw() == b'1\n'
+
+
+def test_frames_split_over_packets():
+    with scripted([[b'#', b'15hel', b'lo\n1', b'2\n']]) as server:
+        interface = SocketInterface(server.address, timeout=2000)
+        interface.read_termination = '\n'
+        interface.write_raw(b'Q?\n')
+        assert interface.read_raw() == b'#15hello\n'
+        assert interface.read_raw() == b'12\n'
@@ -0,0 +1,27 @@
+import pytest
+
+import llrfprof
+from adcutils import CHANNELS
+from simulators import SimulatorFarm
+
+
+@pytest.fixture
+def farm(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    with SimulatorFarm(CHANNELS[0].gain_file, ca_period=.01) as farm:
+        yield farm
+        llrfprof.SESSIONS.close_all()
+
+
+def test_repeat_reuses_the_generator(farm, monkeypatch):
+    answers = iter(['12 14', ''])
+    monkeypatch.setattr(llrfprof, 'input', lambda prompt: next(answers))
+    args = llrfprof.build_parser().parse_args([
+        '10', '12', '-p', '3', '--channels', '0', '--yes', '--repeat',
+        '--gen-addr', '{0}:{1:d}'.format(*farm.gen_addr)])
+    opened, reused = llrfprof.SESSIONS.opened, llrfprof.SESSIONS.reused
+    llrfprof.run(args, ca=farm.ca)
+    assert (args.min, args.max) == (12, 14)
+    assert llrfprof.SESSIONS.opened == opened + 1
+    assert llrfprof.SESSIONS.reused == reused + 1
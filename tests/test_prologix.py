@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+from interfaces import (PrologixEnetController, TempPrologixEnetInterface,
+                        InterfaceTimeoutError)
+from simulators import PrologixServer, FakeInstrument
+
+
+class Named(FakeInstrument):
+    def __init__(self, name):
+        self.idn = name
+        FakeInstrument.__init__(self)
+
+
+class RecordingPrologixServer(PrologixServer):
+    """ keeps every adapter command it receives """
+    def __init__(self, *args, **kwargs):
+        PrologixServer.__init__(self, *args, **kwargs)
+        self.commands = []
+
+    def process(self, message):
+        if message.startswith(b'++'):
+            self.commands.append(message.decode('ascii').strip())
+        return PrologixServer.process(self, message)
+
+
+@pytest.fixture
+def server():
+    with RecordingPrologixServer({5: Named('five'), 18: Named('eighteen')}) as server:
+        yield server
+
+
+@pytest.fixture
+def controller(server):
+    return PrologixEnetController(server.address[0], timeout=2000, port=server.address[1])
+
+
+def open_session(controller, gpib_addr):
+    session = controller.open(gpib_addr)
+    session.read_termination = '\n'
+    session.timeout = 2000
+    return session
+
+
+def query(session, message):
+    session.write_raw(message.encode('ascii') + b'\r\n')
+    return session.read_raw().decode('ascii').strip()
+
+
+def commands(server, name):
+    return [command for command in server.commands if command.startswith(name)]
+
+
+def test_sessions_share_the_socket(server, controller):
+    five, eighteen = open_session(controller, 5), open_session(controller, 18)
+    assert query(five, '*IDN?') == 'five'
+    assert query(eighteen, '*IDN?') == 'eighteen'
+    assert query(five, '*IDN?') == 'five'
+    assert commands(server, '++addr') == ['++addr 5', '++addr 18', '++addr 5']
+    assert server.addr_switches == 3
+
+
+def test_repeat_commands_are_skipped(server, controller):
+    five = open_session(controller, 5)
+    for _ in range(3):
+        query(five, '*IDN?')
+    assert commands(server, '++addr') == ['++addr 5']
+    assert commands(server, '++eos') == ['++eos 0']
+    five.write_termination = '\n'
+    query(five, '*IDN?')
+    assert commands(server, '++eos') == ['++eos 0', '++eos 2']
+
+
+def test_close_and_reopen_the_last_session(server, controller):
+    five = open_session(controller, 5)
+    query(five, '*IDN?')
+    with pytest.raises(ValueError):
+        controller.open(5)
+    five.close()
+    with pytest.raises(ValueError):
+        query(five, '*IDN?')
+    again = open_session(controller, 5)
+    assert query(again, '*IDN?') == 'five'
+    # the closed session was the active one, so the address is sent again
+    assert commands(server, '++addr') == ['++addr 5', '++addr 5']
+
+
+@pytest.fixture
+def slow_server():
+    with RecordingPrologixServer({18: Named('eighteen')}, latency=.05) as server:
+        yield server
+
+
+def temp_interface(server, completion):
+    interface = TempPrologixEnetInterface(18, server.address, timeout=2000,
+                                          completion=completion)
+    server.reset_counts()
+    return interface
+
+
+def temp_query(interface, message):
+    interface.write_raw(message.encode('ascii') + b'\n')
+    return interface.read_raw().decode('ascii').strip()
+
+
+@pytest.mark.parametrize('completion', TempPrologixEnetInterface.COMPLETIONS)
+def test_completion_modes(slow_server, completion):
+    interface = temp_interface(slow_server, completion)
+    assert temp_query(interface, '*IDN?') == 'eighteen'
+    assert interface.read_count == 1
+    assert interface.poll_count == slow_server.polls >= 2
+    # the answer takes .05 s, the interface waited for it instead of polling
+    assert .03 <= interface.wait_time <= .15
+    interface.reset_stats()
+    assert (interface.poll_count, interface.wait_time, interface.read_count) == (0, 0.0, 0)
+
+
+def test_poll_mode_waits_whole_intervals(slow_server):
+    interface = temp_interface(slow_server, 'poll')
+    temp_query(interface, '*IDN?')
+    assert interface.wait_time == pytest.approx(
+        interface.poll_interval * (interface.poll_count - 1))
+
+
+def test_backoff_learns_the_latency(slow_server):
+    interface = temp_interface(slow_server, 'backoff')
+    temp_query(interface, '*IDN?')
+    first = interface.poll_count
+    interface.reset_stats()
+    temp_query(interface, '*IDN?')
+    assert interface.latency == pytest.approx(.05, abs=.03)
+    # the first poll waits for the expected answer
+    assert interface.poll_count <= min(first, 3)
+
+
+def test_srq_mode_times_out(slow_server):
+    interface = temp_interface(slow_server, 'srq')
+    interface.timeout = 200
+    interface.write_raw(b'POW -5\n')
+    start = time.time()
+    with pytest.raises(InterfaceTimeoutError):
+        interface.read_raw()
+    assert .2 <= time.time() - start < .5
+    assert interface.timeout == 200
+    # only the SRQ line was checked, the device was never serial polled
+    assert interface.poll_count == slow_server.polls > 0
+    assert commands(slow_server, '++spoll') == []
+    assert interface.read_count == 0
+    assert temp_query(interface, '*IDN?') == 'eighteen'
@@ -0,0 +1,55 @@
+import socket
+
+import pytest
+
+from bncinst import BNC845
+from interfaces import SocketInterface
+from sessions import SessionRegistry
+from simulators import SimulatorServer, FakeBNC845
+
+
+@pytest.fixture
+def server():
+    with SimulatorServer(FakeBNC845()) as server:
+        yield server
+
+
+def opener(server):
+    return lambda: BNC845(SocketInterface(server.address, timeout=2000))
+
+
+def test_same_address_reuses_the_session(server):
+    registry = SessionRegistry()
+    gen = registry.get(server.address, opener(server))
+    assert registry.get(server.address, opener(server)) is gen
+    assert (registry.opened, registry.reused, registry.reopened) == (1, 1, 0)
+    # the reuse cost one *OPC? round trip
+    assert server.round_trips == 1
+
+
+def test_failed_check_reopens(server):
+    registry = SessionRegistry()
+    gen = registry.get(server.address, opener(server))
+    gen._interface.close()
+    again = registry.get(server.address, opener(server))
+    assert again is not gen
+    assert (registry.opened, registry.reused, registry.reopened) == (2, 0, 1)
+    assert int(again.query('*OPC?')) == 1
+
+
+def test_check_interval_skips_the_check(server):
+    registry = SessionRegistry(check_interval=60)
+    gen = registry.get(server.address, opener(server))
+    assert registry.get(server.address, opener(server)) is gen
+    assert server.round_trips == 0
+
+
+def test_close_all(server):
+    registry = SessionRegistry()
+    gen = registry.get(server.address, opener(server))
+    registry.get('other', opener(server))
+    assert len(registry) == 2
+    registry.close_all()
+    assert len(registry) == 0 and server.address not in registry
+    with pytest.raises(socket.error):
+        gen.query('*OPC?')
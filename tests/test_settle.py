@@ -0,0 +1,100 @@
+import math
+import time
+
+import pytest
+
+from adcutils import ADCMonitor, adc_vals, CHANNELS
+from settle import ThresholdSettle, ExponentialSettle, UpdateSettle
+from simulators import FakeCA, FakeBNC845, ChassisModel
+
+
+class Step(object):
+    """ adc PV values rising to level with time constant tau after start() """
+    def __init__(self, level=10000.0, tau=.05):
+        self.level = level
+        self.tau = tau
+        self.started = time.time()
+
+    def start(self):
+        self.started = time.time()
+
+    def __call__(self, pvname):
+        value = self.level * (1 - math.exp(-(time.time() - self.started) / self.tau))
+        return -value if pvname.endswith('_min') else value
+
+
+def counting(measure):
+    def counted():
+        counted.calls += 1
+        return measure()
+    counted.calls = 0
+    return counted
+
+
+def test_threshold_exits_early_on_a_settled_reading():
+    ca = FakeCA(Step(tau=1E-6))
+    settle = ThresholdSettle(lambda: adc_vals('adc4', ca), tolerance=8, interval=.01)
+    settle.point()
+    assert settle.times[0] < .05
+    assert settle.timeouts == 0
+
+
+def settle_steps(strategy, points=3, tau=.02):
+    """ runs strategy over points steps with time constant tau, returns it and its polls """
+    step = Step(tau=tau)
+    ca = FakeCA(step)
+    measure = counting(lambda: adc_vals('adc4', ca))
+    settle = strategy(measure, tolerance=8)
+    for _ in range(points):
+        step.start()
+        settle.point()
+    return settle, measure.calls
+
+
+def test_threshold_waits_until_the_step_settles():
+    settle, _ = settle_steps(ThresholdSettle)
+    # readings .01 s apart agree within 8 counts about 5.5 time constants in
+    assert len(settle.times) == 3
+    assert all(.08 < waited < .25 for waited in settle.times)
+    assert settle.timeouts == 0
+    assert settle.value[1] == pytest.approx(10000, abs=20)
+
+
+def test_exponential_polls_less_often():
+    threshold, threshold_polls = settle_steps(ThresholdSettle)
+    exponential, exponential_polls = settle_steps(ExponentialSettle)
+    assert exponential.timeouts == 0
+    assert all(waited < exponential.max_wait for waited in exponential.times)
+    # the growing intervals take far fewer readings and settle closer
+    assert exponential_polls < .75 * threshold_polls
+    assert exponential.value[1] == pytest.approx(10000, abs=8)
+
+
+def test_noisy_channel_times_out():
+    generator = FakeBNC845()
+    generator.settings['OUTP'] = 1.0
+    model = ChassisModel(generator, noise=100.0)
+    ca = FakeCA(model.pv_value)
+    settle = ThresholdSettle(lambda: adc_vals(CHANNELS[0].adc, ca), tolerance=8,
+                             max_wait=.1)
+    settle.point()
+    settle.point()
+    assert settle.timeouts == 2
+    assert settle.times == [pytest.approx(.1, abs=.03)] * 2
+
+
+def test_update_waits_for_the_next_update():
+    ca = FakeCA(Step(tau=1E-6), period=.1)
+    monitor = ADCMonitor(['adc4'], ca=ca)
+    try:
+        settle = UpdateSettle(lambda after, timeout: monitor.wait_update('adc4', after, timeout))
+        for _ in range(3):
+            settle.point()
+    finally:
+        monitor.close()
+        ca.stop()
+    # each point waits for the next update, at most one period
+    assert all(waited <= .13 for waited in settle.times)
+    assert sum(settle.times) > .1
+    assert ca.posts >= 2 * 3
+    assert settle.value == (-10000.0, 10000.0)
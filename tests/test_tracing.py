@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from bncinst import BNC845
+from interfaces import SocketInterface
+from simulators import SimulatorServer, FakeBNC845
+from tracing import Tracer, command_key
+
+
+@pytest.fixture
+def gen():
+    with SimulatorServer(FakeBNC845()) as server:
+        yield BNC845(SocketInterface(server.address, timeout=2000))
+
+
+def test_second_tracer_takes_over(gen):
+    first = Tracer().attach(gen)
+    gen.query(':POW?')
+    events = first.count
+    second = Tracer().attach(gen)
+    gen.query(':POW?')
+    assert events > 0
+    assert first.count == events and second.count == events
+    second.detach()
+    first.detach()
+    assert 'query' not in vars(gen) and 'read_raw' not in vars(gen._interface)
+
+
+def test_command_key():
+    assert command_key(b':POW -10;:POW?\n') == ':POW;:POW?'
+
+
+def test_summary_and_histogram_count_calls(gen):
+    tracer = Tracer().attach(gen)
+    for _ in range(3):
+        gen.query(':POW?')
+    gen.query(':FREQ?')
+    summary = tracer.summary()
+    assert summary[('BNC845.query', ':POW?')]['count'] == 3
+    assert summary[('BNC845.query', ':FREQ?')]['count'] == 1
+    assert summary[('SocketInterface.read_raw', ':POW?')]['bytes'] > 0
+    counts, edges = tracer.histogram('.query')
+    assert counts.sum() == 4 and edges.size == counts.size + 1
+    assert tracer.histogram('.query', ':POW?')[0].sum() == 3
+    assert ':POW?' in tracer.report()
+
+
+def test_ring_buffer_drops_old_events(gen):
+    tracer = Tracer(capacity=4).attach(gen)
+    for _ in range(3):
+        gen.query(':POW?')
+    assert len(tracer.events) == 4
+    assert tracer.count > 4
+    assert "older events dropped" in tracer.report()
+    tracer.clear()
+    assert len(tracer.events) == 0 and tracer.count == 0
+
+
+def test_chrome_trace_shape(gen, tmp_path):
+    tracer = Tracer().attach(gen)
+    gen.query(':POW?')
+    path = str(tmp_path / 'trace.json')
+    tracer.export_chrome_trace(path)
+    with open(path) as trace_file:
+        trace = json.load(trace_file)
+    assert trace['displayTimeUnit'] == 'ms'
+    assert len(trace['traceEvents']) == len(tracer.events)
+    for event in trace['traceEvents']:
+        assert event['ph'] == 'X'
+        assert set(event) == {'name', 'cat', 'ph', 'pid', 'tid', 'ts', 'dur', 'args'}
+        assert event['dur'] >= 0 and event['ts'] >= 0
+        assert set(event['args']) == {'bytes', 'polls', 'error'}
+    assert {event['name'] for event in trace['traceEvents']} == {':POW?'}
+
+
+def test_detach_restores_the_methods(gen):
+    interface = gen._interface
+    tracer = Tracer().attach(gen)
+    assert 'query' in vars(gen) and 'read_raw' in vars(interface)
+    tracer.detach()
+    assert not set(vars(gen)) & {'write', 'read', 'query', 'write_raw', 'read_raw'}
+    assert not set(vars(interface)) & {'write_raw', 'read_raw'}
+    gen.query(':POW?')
+    assert tracer.count == 0
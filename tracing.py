@@ -0,0 +1,206 @@
+"""
+per command timing of device and interface I/O
+
+A Tracer wraps the I/O methods of devices (write, read, query, write_raw,
+read_raw) and interfaces (write_raw, read_raw) it is attached to and records
+one event per call in a ring buffer: the SCPI command, bytes, start time,
+duration, serial polls made by the interface and whether it timed out.
+Nothing is wrapped until attach(), so untraced devices pay no overhead.
+
+    tracer = Tracer()
+    tracer.attach(gen, spec)
+    gen.power_sweep(...)
+    print(tracer.report())
+    tracer.export_chrome_trace('sweep.json')  # open in chrome://tracing
+"""
+from __future__ import print_function
+import os
+import json
+import socket
+import threading
+from collections import deque, namedtuple
+from functools import wraps
+import numpy as np
+
+from interfaces import InterfaceTimeoutError
+
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from time import time as clock
+
+Event = namedtuple('Event', ['kind', 'command', 'nbytes', 'start', 'duration', 'polls',
+                             'error', 'thread'])
+
+DEVICE_METHODS = ('write', 'read', 'query', 'write_raw', 'read_raw')
+INTERFACE_METHODS = ('write_raw', 'read_raw')
+
+
+def command_key(message):
+    """ returns the headers of a (compound) SCPI message, e.g. ':POW;:POW?' """
+    if isinstance(message, (bytes, bytearray)):
+        message = message.decode('ascii', 'replace')
+    return ';'.join(cmd.strip().split(' ')[0] for cmd in message.strip().split(';')
+                    if cmd.strip())
+
+
+class Tracer(object):
+    """
+    records device and interface I/O events
+
+    Parameters
+    ----------
+    capacity : int, optional
+        events kept, older events are dropped
+
+    Attributes
+    ----------
+    events : deque
+        the recorded Events, oldest first
+    count : int
+        events recorded, including dropped ones
+    """
+    def __init__(self, capacity=65536):
+        self.events = deque(maxlen=capacity)
+        self.count = 0
+        self.origin = clock()
+        self._attached = []
+        self._last = {} # id(target): key of the last command written
+
+    def attach(self, *targets):
+        """
+        traces devices (and their interfaces) and interfaces, returns self
+
+        a method traced by another tracer is taken over by this one
+        """
+        for target in targets:
+            methods = DEVICE_METHODS if hasattr(target, 'query') else INTERFACE_METHODS
+            for name in methods:
+                current = vars(target).get(name)
+                tracer = getattr(current, 'tracer', None)
+                if tracer is self or (current is not None and tracer is None):
+                    continue
+                method = getattr(target, name) if current is None else current.original
+                setattr(target, name, self._wrap(target, name, method))
+                self._attached.append((target, name))
+            interface = getattr(target, '_interface', None)
+            if interface is not None:
+                self.attach(interface)
+        return self
+
+    def detach(self):
+        """ restores every method still traced by this tracer """
+        for target, name in self._attached:
+            if getattr(vars(target).get(name), 'tracer', None) is self:
+                delattr(target, name)
+        self._attached = []
+
+    def _wrap(self, target, name, method):
+        """ returns method recording an event of kind name per call """
+        kind = type(target).__name__ + '.' + name
+        source = getattr(target, '_interface', target)
+        writes = name.startswith('write') or name == 'query'
+        last = self._last
+        key = id(target)
+        events = self.events
+
+        @wraps(method)
+        def traced(*args, **kwargs):
+            if writes and args:
+                command = last[key] = command_key(args[0])
+            else:
+                command = last.get(key, '')
+            polls = getattr(source, 'poll_count', 0)
+            error = None
+            start = clock()
+            try:
+                ret = method(*args, **kwargs)
+            except (InterfaceTimeoutError, socket.timeout):
+                error = 'timeout'
+                raise
+            except Exception as err:
+                error = type(err).__name__
+                raise
+            finally:
+                duration = clock() - start
+                if error is not None:
+                    ret = None
+                nbytes = len(args[0]) if writes and args else len(ret) if ret is not None else 0
+                events.append(Event(kind, command, nbytes, start, duration,
+                                    getattr(source, 'poll_count', 0) - polls, error,
+                                    threading.current_thread().ident))
+                self.count += 1
+            return ret
+        traced.tracer = self
+        traced.original = method
+        return traced
+
+    def clear(self):
+        """ drops every recorded event """
+        self.events.clear()
+        self.count = 0
+
+    def durations(self, kind=None, command=None):
+        """ array of the durations (seconds) of events matching kind and command """
+        return np.array([event.duration for event in self.events
+                         if (kind is None or event.kind.endswith(kind)) and
+                         (command is None or event.command == command)])
+
+    def summary(self):
+        """
+        returns {(kind, command): stats} with count, total, p50, p90, p99 and
+        max seconds, bytes, polls and timeouts of each kind of call and command
+        """
+        groups = {}
+        for event in self.events:
+            groups.setdefault((event.kind, event.command), []).append(event)
+        stats = {}
+        for group, events in groups.items():
+            durations = np.array([event.duration for event in events])
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            stats[group] = {'count': len(events), 'total': float(durations.sum()),
+                            'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+                            'max': float(durations.max()),
+                            'bytes': sum(event.nbytes for event in events),
+                            'polls': sum(event.polls for event in events),
+                            'timeouts': sum(1 for event in events if event.error == 'timeout')}
+        return stats
+
+    def histogram(self, kind=None, command=None, bins=None):
+        """
+        returns (counts, edges) of event durations in seconds, by default in
+        bins growing by powers of two from 10 us to about 10 s
+        """
+        if bins is None:
+            bins = 1E-5 * 2.0 ** np.arange(21)
+        return np.histogram(self.durations(kind, command), bins)
+
+    def report(self, kinds=('.query', '.write', '.read')):
+        """ returns a table of the summary of device level calls, slowest first """
+        rows = sorted(((group, stats) for group, stats in self.summary().items()
+                       if group[0].endswith(kinds)),
+                      key=lambda row: -row[1]['total'])
+        lines = ["{0:<28}{1:<32}{2:>7}{3:>10}{4:>10}{5:>10}{6:>7}{7:>5}".format(
+            'call', 'command', 'count', 'total s', 'p50 ms', 'p99 ms', 'polls', 't/o')]
+        for (kind, command), stats in rows:
+            lines.append("{0:<28}{1:<32}{2:>7d}{3:>10.3f}{4:>10.2f}{5:>10.2f}{6:>7d}{7:>5d}".format(
+                kind, command[:31], stats['count'], stats['total'], stats['p50'] * 1E3,
+                stats['p99'] * 1E3, stats['polls'], stats['timeouts']))
+        if self.count > len(self.events):
+            lines.append("({0:d} older events dropped)".format(self.count - len(self.events)))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        """ returns the events in the Chrome trace event format """
+        pid = os.getpid()
+        return {'traceEvents': [
+            {'name': event.command or event.kind, 'cat': event.kind, 'ph': 'X', 'pid': pid,
+             'tid': event.thread, 'ts': (event.start - self.origin) * 1E6,
+             'dur': event.duration * 1E6,
+             'args': {'bytes': event.nbytes, 'polls': event.polls, 'error': event.error}}
+            for event in self.events], 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, filename):
+        """ writes the events as a Chrome trace (chrome://tracing, Perfetto) JSON file """
+        with open(filename, 'w') as trace_file:
+            json.dump(self.chrome_trace(), trace_file)